@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Per-event cost of the pointer shape update done on every motion event:
+# a new cursor and set_cursor for each event (before) against the cached
+# cursors that are only set when the shape changes (after).
+# Needs a display (use xvfb-run on headless machines).
+#
+#   python3 benchmarks/cursor_events.py [--events 20000]
+
+import argparse
+import math
+import os
+import sys
+import time
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+from gi.repository import Gdk
+
+from src import Interface
+from src.Geometry import CropBox
+
+def makeTrace(events):
+  # the pointer circles around a corner of the selector, crossing its borders
+  box = CropBox(800, 600)
+  box.set(200, 150, 400, 300)
+  trace = []
+  for i in range(events):
+    angle = i * 2 * math.pi / 500
+    x = 200 + 20 * math.cos(angle)
+    y = 150 + 20 * math.sin(angle * 3)
+    trace.append(box.getResizeType(x, y))
+  return trace
+
+def getCursorTypes(interface, trace):
+  # cursor type of each resize type, as chosen by setPointerResize
+  cursor_types = {}
+  for resize_type in set(trace):
+    interface.changeCursorType = lambda cursor_type: cursor_types.__setitem__(resize_type, cursor_type)
+    interface.setPointerResize(resize_type)
+  del interface.changeCursorType
+  return cursor_types
+
+def uncachedCursor(window, cursor_type):
+  display = Gdk.Display.get_default()
+  cursor = Gdk.Cursor.new_for_display(display, cursor_type)
+  window.get_window().set_cursor(cursor)
+
+def main():
+  parser = argparse.ArgumentParser(description='Cursor update benchmark')
+  parser.add_argument('--events', type=int, default=20000)
+  args = parser.parse_args()
+  if Gdk.Display.get_default() is None:
+    sys.exit('No display available')
+  window = Gtk.Window()
+  window.show_all()
+  while Gtk.events_pending():
+    Gtk.main_iteration()
+  trace = makeTrace(args.events)
+  # the Interface methods only need the window and the cursor state
+  interface = Interface.Interface.__new__(Interface.Interface)
+  interface.main_window = window
+  interface.cursors_display = None
+  interface.cursor_type = None
+  # the mapping is looked up outside the timing, so that the before loop
+  # only runs the uncached path
+  cursor_types = getCursorTypes(interface, trace)
+  start = time.perf_counter()
+  for resize_type in trace:
+    uncachedCursor(window, cursor_types[resize_type])
+  before = time.perf_counter() - start
+  start = time.perf_counter()
+  for resize_type in trace:
+    interface.setPointerResize(resize_type)
+  after = time.perf_counter() - start
+  changes = len([i for i in range(1, len(trace)) if trace[i] != trace[i - 1]])
+  print('%d events, %d cursor changes' % (len(trace), changes))
+  print('before  %8.2f us/event' % (before / len(trace) * 1e6))
+  print('after   %8.2f us/event' % (after / len(trace) * 1e6))
+
+if __name__ == '__main__':
+  main()
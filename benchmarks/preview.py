@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Preview loading: full decode + scale (before) against decoding directly
+# at the preview size (after).
+#
+#   python3 benchmarks/preview.py [--megapixels 24 48 100] [--repeat 3]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from PIL import Image
+
+from src import Crop
+from src.Geometry import getScaleFactor
+
+WIN_WIDTH = 800
+WIN_HEIGHT = 600
+
+try:
+  import gi
+  gi.require_version('GdkPixbuf', '2.0')
+  from gi.repository import GdkPixbuf
+except (ImportError, ValueError):
+  GdkPixbuf = None
+
+def makeImage(path, megapixels):
+  height = int((megapixels * 1e6 * 2 / 3) ** 0.5)
+  width = int(height * 3 / 2)
+  # a gradient compresses like a photo better than a flat colour
+  image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+  image.save(path, quality=90)
+  return width, height
+
+## METHODS
+def pilFull(path):
+  image = Image.open(path)
+  image.load()
+  width, height = image.size
+  factor = getScaleFactor(width, height, WIN_WIDTH, WIN_HEIGHT)
+  return image.resize((int(width * factor), int(height * factor)), Image.BILINEAR)
+
+def pilDraft(path):
+  image, _ = Crop.openPreview(path, WIN_WIDTH, WIN_HEIGHT)
+  return image
+
+def pixbufFull(path):
+  pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+  width, height = pixbuf.get_width(), pixbuf.get_height()
+  factor = getScaleFactor(width, height, WIN_WIDTH, WIN_HEIGHT)
+  return pixbuf.scale_simple(width * factor, height * factor, GdkPixbuf.InterpType.BILINEAR)
+
+def pixbufAtScale(path):
+  _, width, height = GdkPixbuf.Pixbuf.get_file_info(path)
+  factor = getScaleFactor(width, height, WIN_WIDTH, WIN_HEIGHT)
+  return GdkPixbuf.Pixbuf.new_from_file_at_scale(path, int(width * factor), int(height * factor), False)
+
+def timeIt(method, path, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    method(path)
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+def main():
+  parser = argparse.ArgumentParser(description='Preview loading benchmark')
+  parser.add_argument('--megapixels', type=float, nargs='+', default=[24, 48, 100])
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+  pairs = [('PIL', pilFull, pilDraft)]
+  if GdkPixbuf is not None:
+    pairs.append(('GdkPixbuf', pixbufFull, pixbufAtScale))
+  with tempfile.TemporaryDirectory() as folder:
+    for megapixels in args.megapixels:
+      path = os.path.join(folder, 'image.jpg')
+      width, height = makeImage(path, megapixels)
+      for name, before, after in pairs:
+        time_before = timeIt(before, path, args.repeat)
+        time_after = timeIt(after, path, args.repeat)
+        print('%5.0f MP %5dx%-5d %-9s before %8.1f ms  after %8.1f ms  (%.1fx)' % \
+              (megapixels, width, height, name, time_before * 1000, time_after * 1000, time_before / time_after))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Benchmark suite: selector geometry over synthetic pointer traces, image
+# load latency for several sizes and formats, and save latency and peak
+# memory. Nothing needs a display: the geometry is CropBox (the Selector
+# without GTK) and images are loaded through the tile pyramid the GUI
+# draws from (converted to pixbufs too when GTK can be imported).
+#
+#   python3 benchmarks/run.py run [--quick] [--output results.json]
+#   python3 benchmarks/run.py compare baseline.json results.json [--threshold 0.1]
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from PIL import Image
+
+from src import Crop
+from src import Pyramid
+from src.Geometry import CropBox, getScaleFactor
+from src.Geometry import RESIZE_RIGHT, RESIZE_LEFT, RESIZE_TOP, RESIZE_BOTTOM
+from src.Geometry import RESIZE_TOP_RIGHT, RESIZE_TOP_LEFT, RESIZE_BOTTOM_RIGHT, RESIZE_BOTTOM_LEFT
+
+VIEW_WIDTH = 800
+VIEW_HEIGHT = 600
+
+SEED = 1234
+
+LOAD_FORMATS = ('JPEG', 'PNG', 'TIFF')
+LOAD_MEGAPIXELS = (2, 12, 24)
+SAVE_MEGAPIXELS = 12
+
+# geometry runs are repeated for at least this long (seconds)
+GEOMETRY_TIME = 0.5
+
+# relative change over which compare flags a regression
+DEFAULT_THRESHOLD = 0.1
+
+def makeResult(value, unit, better):
+  return {'value': value, 'unit': unit, 'better': better}
+
+def bestOf(function, repeat, min_time=0):
+  # fastest of at least repeat runs, taking at least min_time in total
+  best = None
+  runs = 0
+  spent = 0
+  while runs < repeat or spent < min_time:
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+    runs += 1
+    spent += elapsed
+  return best
+
+## GEOMETRY
+def makeBox(fix_ratio):
+  box = CropBox(VIEW_WIDTH, VIEW_HEIGHT)
+  box.fixRatio(fix_ratio)
+  box.set(200, 150, 400, 225)
+  return box
+
+def makePointerTrace(events, rng):
+  # the pointer wanders over the view, often near the selector borders
+  trace = []
+  x, y = VIEW_WIDTH / 2, VIEW_HEIGHT / 2
+  for i in range(events):
+    x = min(max(x + rng.gauss(0, 12), 0), VIEW_WIDTH)
+    y = min(max(y + rng.gauss(0, 12), 0), VIEW_HEIGHT)
+    trace.append((x, y))
+  return trace
+
+def makeDragTrace(events):
+  # back and forth drags of 150 pixels around the starting border
+  trace = []
+  for i in range(events):
+    angle = i * 2 * math.pi / 240
+    trace.append((150 * math.sin(angle), 150 * math.cos(angle * 0.7)))
+  return trace
+
+RESIZE_METHODS = ((RESIZE_BOTTOM, 'resizeBottom', (400, 375)),
+                  (RESIZE_RIGHT, 'resizeRight', (600, 262)),
+                  (RESIZE_TOP, 'resizeTop', (400, 150)),
+                  (RESIZE_LEFT, 'resizeLeft', (200, 262)),
+                  (RESIZE_TOP_LEFT, 'resizeTopLeft', (200, 150)),
+                  (RESIZE_TOP_RIGHT, 'resizeTopRight', (600, 150)),
+                  (RESIZE_BOTTOM_LEFT, 'resizeBottomLeft', (200, 375)),
+                  (RESIZE_BOTTOM_RIGHT, 'resizeBottomRight', (600, 375)))
+
+def benchGeometry(events, repeat):
+  results = {}
+  rng = random.Random(SEED)
+  pointer = makePointerTrace(events, rng)
+  box = makeBox(True)
+  def getResizeTypes():
+    for x, y in pointer:
+      box.getResizeType(x, y)
+  elapsed = bestOf(getResizeTypes, repeat, GEOMETRY_TIME)
+  results['geometry.getResizeType'] = makeResult(events / elapsed, 'ops/s', 'higher')
+  drag = makeDragTrace(events)
+  for fix_ratio in (True, False):
+    name = 'geometry.resize.' + ('fixed' if fix_ratio else 'free')
+    def resizeAll():
+      for resize_type, method, (start_x, start_y) in RESIZE_METHODS:
+        box = makeBox(fix_ratio)
+        resize = getattr(box, method)
+        for delta_x, delta_y in drag:
+          resize(start_x + delta_x, start_y + delta_y)
+    elapsed = bestOf(resizeAll, repeat, GEOMETRY_TIME)
+    results[name] = makeResult(events * len(RESIZE_METHODS) / elapsed, 'ops/s', 'higher')
+  def moveAll():
+    box = makeBox(True)
+    for delta_x, delta_y in drag:
+      box.moveTo(300 + delta_x, 200 + delta_y)
+  elapsed = bestOf(moveAll, repeat, GEOMETRY_TIME)
+  results['geometry.moveTo'] = makeResult(events / elapsed, 'ops/s', 'higher')
+  areas = [(rng.uniform(20, VIEW_WIDTH), rng.uniform(20, VIEW_HEIGHT)) for _ in range(events)]
+  def fitAll():
+    for width, height in areas:
+      box.fitToArea(width, height)
+  elapsed = bestOf(fitAll, repeat, GEOMETRY_TIME)
+  results['geometry.fitToArea'] = makeResult(events / elapsed, 'ops/s', 'higher')
+  return results
+
+## IMAGES
+def makeImage(path, megapixels, image_format):
+  height = int((megapixels * 1e6 * 2 / 3) ** 0.5)
+  width = int(height * 3 / 2)
+  gradient = Image.linear_gradient('L').resize((width, height))
+  noise = Image.effect_noise((width, height), 40)
+  image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+  if image_format == 'JPEG':
+    image.save(path, format='JPEG', quality=90)
+  else:
+    image.save(path, format=image_format)
+  return width, height
+
+def getConverter():
+  # the GUI converts every tile to a pixbuf; skipped without GTK
+  try:
+    from src import Interface
+  except Exception:
+    return None
+  return Interface.imageToPixbuf
+
+def benchLoad(folder, megapixels_list, repeat):
+  results = {}
+  convert = getConverter()
+  for megapixels in megapixels_list:
+    for image_format in LOAD_FORMATS:
+      path = os.path.join(folder, 'load-%d.%s' % (megapixels, image_format.lower()))
+      makeImage(path, megapixels, image_format)
+      def load():
+        # what Interface.loadImage waits for on a cache miss
+        pyramid = Pyramid.TilePyramid(path, convert=convert)
+        width, height = pyramid.getSize()
+        pyramid.loadView(getScaleFactor(width, height, VIEW_WIDTH, VIEW_HEIGHT))
+      elapsed = bestOf(load, repeat)
+      name = 'load.%s.%dmp' % (image_format.lower(), megapixels)
+      results[name] = makeResult(elapsed * 1000, 'ms', 'lower')
+  return results
+
+def saveChild(path, box, output_format, repeat):
+  # run in a fresh process, so that the peak memory is the save's own
+  elapsed = bestOf(lambda: Crop.saveCrop(path, box, output_format, Crop.DEFAULT_QUALITY, None), repeat)
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    peak = peak / 1024
+  print(json.dumps({'elapsed': elapsed, 'peak_kb': peak}))
+
+def benchSave(folder, megapixels, repeat):
+  results = {}
+  path = os.path.join(folder, 'save.jpg')
+  width, height = makeImage(path, megapixels, 'JPEG')
+  # the selector set by resetSelector: half the image, at the top left
+  box = (0, 0, int(width / 2), int(height / 2))
+  formats = [Crop.FORMAT_PNG, Crop.FORMAT_SAME]
+  if Crop.canCropLossless(path):
+    formats.append(Crop.FORMAT_LOSSLESS)
+  for output_format in formats:
+    command = [sys.executable, os.path.abspath(__file__), 'save-child', path, ','.join([str(value) for value in box]), output_format, '--repeat', str(repeat)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    child = json.loads(output.splitlines()[-1])
+    results['save.%s.latency' % output_format] = makeResult(child['elapsed'] * 1000, 'ms', 'lower')
+    results['save.%s.peak_rss' % output_format] = makeResult(child['peak_kb'] / 1024, 'MB', 'lower')
+  return results
+
+## COMMANDS
+def getMeta():
+  return {'python': platform.python_version(),
+          'pil': Image.__version__,
+          'platform': platform.platform(),
+          'machine': platform.machine(),
+          'cpus': os.cpu_count(),
+          'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def printResults(results):
+  for name, result in sorted(results.items()):
+    print('%-28s %14.2f %s' % (name, result['value'], result['unit']))
+
+def runSuite(args):
+  events = 20000 if args.quick else 100000
+  repeat = 3 if args.quick else 5
+  megapixels = LOAD_MEGAPIXELS[:2] if args.quick else LOAD_MEGAPIXELS
+  results = {}
+  results.update(benchGeometry(events, repeat))
+  with tempfile.TemporaryDirectory() as folder:
+    results.update(benchLoad(folder, megapixels, repeat))
+    results.update(benchSave(folder, SAVE_MEGAPIXELS, repeat))
+  printResults(results)
+  if args.output is not None:
+    with open(args.output, 'w') as hand:
+      json.dump({'meta': getMeta(), 'results': results}, hand, indent=2)
+    print('Results written to ' + args.output)
+
+def compare(args):
+  with open(args.baseline, 'r') as hand:
+    baseline = json.load(hand)['results']
+  with open(args.results, 'r') as hand:
+    results = json.load(hand)['results']
+  regressions = 0
+  for name in sorted(set(baseline) | set(results)):
+    if not name in baseline or not name in results:
+      print('%-28s only in %s' % (name, 'the baseline' if name in baseline else 'the results'))
+      continue
+    old = baseline[name]['value']
+    new = results[name]['value']
+    change = (new - old) / old if old != 0 else 0
+    if results[name]['better'] == 'higher':
+      worse = -change
+    else:
+      worse = change
+    flag = ''
+    if worse > args.threshold:
+      flag = '  REGRESSION'
+      regressions += 1
+    elif worse < -args.threshold:
+      flag = '  improved'
+    print('%-28s %12.2f -> %12.2f %-5s %+7.1f%%%s' % (name, old, new, results[name]['unit'], change * 100, flag))
+  print('%d regressions over %d%%' % (regressions, args.threshold * 100))
+  sys.exit(1 if regressions > 0 else 0)
+
+def main():
+  parser = argparse.ArgumentParser(description='Image crop benchmark suite')
+  commands = parser.add_subparsers(dest='command', required=True)
+  run_parser = commands.add_parser('run', help='Run the benchmarks')
+  run_parser.add_argument('--quick', action='store_true', help='Shorter traces, fewer repeats and sizes')
+  run_parser.add_argument('--output', metavar='FILE', default=None, help='Write the results as JSON')
+  compare_parser = commands.add_parser('compare', help='Compare results against a baseline')
+  compare_parser.add_argument('baseline')
+  compare_parser.add_argument('results')
+  compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Relative change flagged as a regression (default: 0.1)')
+  child_parser = commands.add_parser('save-child')
+  child_parser.add_argument('path')
+  child_parser.add_argument('box')
+  child_parser.add_argument('format')
+  child_parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+  if args.command == 'run':
+    runSuite(args)
+  elif args.command == 'compare':
+    compare(args)
+  else:
+    box = tuple([int(value) for value in args.box.split(',')])
+    saveChild(args.path, box, args.format, args.repeat)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Bytes written and save time of a JPEG crop for each output format:
+# png (the previous behaviour), same format re-encode and lossless crop.
+#
+#   python3 benchmarks/save_formats.py [--megapixels 24] [--quality 90]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from PIL import Image
+
+from src import Crop
+
+def makeImage(path, megapixels):
+  height = int((megapixels * 1e6 * 2 / 3) ** 0.5)
+  width = int(height * 3 / 2)
+  gradient = Image.linear_gradient('L').resize((width, height))
+  noise = Image.effect_noise((width, height), 40)
+  image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+  image.save(path, quality=90)
+  return width, height
+
+def main():
+  parser = argparse.ArgumentParser(description='Output format benchmark')
+  parser.add_argument('--megapixels', type=float, default=24)
+  parser.add_argument('--quality', type=int, default=Crop.DEFAULT_QUALITY)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+  with tempfile.TemporaryDirectory() as folder:
+    path = os.path.join(folder, 'image.jpg')
+    width, height = makeImage(path, args.megapixels)
+    box = (int(width / 8) + 3, int(height / 8) + 5, int(width * 7 / 8), int(height * 7 / 8))
+    print('Source %dx%d (%d bytes), crop %s' % (width, height, os.path.getsize(path), box))
+    for output_format in Crop.OUTPUT_FORMATS:
+      if output_format == Crop.FORMAT_LOSSLESS and not Crop.canCropLossless(path):
+        print('%-9s skipped: %s not found' % (output_format, Crop.JPEGTRAN))
+        continue
+      best = None
+      for _ in range(args.repeat):
+        start = time.perf_counter()
+        # no cache: every repeat decodes the source, as the lossless crop
+        # reads the file every time
+        savepath = Crop.saveCrop(path, box, output_format, args.quality, cache=None)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(savepath)
+        os.remove(savepath)
+        if best is None or elapsed < best:
+          best = elapsed
+      print('%-9s %12d bytes %10.1f ms' % (output_format, size, best * 1000))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Import time of each way crop.py is started, from python -X importtime,
+# and the modules each of them must not load (GTK outside the GUI, NumPy
+# unless an automatic crop is asked for, ...). With --baseline the run
+# fails when a mode imports a forbidden module or its import time grows
+# over the threshold.
+#
+#   python3 benchmarks/startup.py [--repeat 5] [--save baseline.json]
+#   python3 benchmarks/startup.py --baseline baseline.json [--threshold 0.2]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CROP = os.path.join(MAIN_FOLDER, 'crop.py')
+
+# import time differences below this are noise (microseconds)
+MIN_REGRESSION = 5000
+
+def getModes(folder):
+  # mode: (arguments, standard input, modules it must not import)
+  image = os.path.join(folder, 'image.png')
+  return {'help': ([CROP, '--help'], None, ('gi', 'PIL', 'numpy')),
+          'filter': ([CROP, '-', '--ratio', '1:1'], image, ('gi', 'numpy', 'multiprocessing')),
+          'batch': ([CROP, '--batch', folder, '--ratio', '1:1', '--jobs', '1'], None, ('gi', 'numpy')),
+          'gui': (['-c', 'from src import Interface'], None, ('numpy', 'multiprocessing'))}
+
+def hasGtk():
+  command = [sys.executable, '-c', 'import gi; gi.require_version("Gtk", "3.0"); from gi.repository import Gtk']
+  return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+def parseImportTime(text):
+  # total import time (sum of the top level imports) and imported modules
+  total = 0
+  modules = set()
+  for line in text.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    modules.add(name.strip())
+    if not name.startswith('  '):
+      total += int(cumulative)
+  return total, modules
+
+def measure(arguments, stdin, repeat):
+  best = None
+  modules = set()
+  for _ in range(repeat):
+    command = [sys.executable, '-X', 'importtime'] + arguments
+    hand = open(stdin, 'rb') if stdin is not None else subprocess.DEVNULL
+    try:
+      result = subprocess.run(command, cwd=MAIN_FOLDER, stdin=hand, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    finally:
+      if stdin is not None:
+        hand.close()
+    total, modules = parseImportTime(result.stderr)
+    best = total if best is None else min(best, total)
+  return best, modules
+
+def getForbidden(modules, forbidden):
+  return sorted([name for name in modules if name.split('.')[0] in forbidden])
+
+def main():
+  parser = argparse.ArgumentParser(description='Startup time benchmark')
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--save', metavar='FILE', default=None, help='Write the results as a baseline')
+  parser.add_argument('--baseline', metavar='FILE', default=None, help='Fail on regressions against a baseline')
+  parser.add_argument('--threshold', type=float, default=0.2, help='Largest relative slowdown (default: 0.2)')
+  args = parser.parse_args()
+  baseline = None
+  if args.baseline is not None:
+    with open(args.baseline, 'r') as hand:
+      baseline = json.load(hand)
+  results = {}
+  failed = False
+  with tempfile.TemporaryDirectory() as folder:
+    from PIL import Image
+    Image.new('RGB', (64, 48), (40, 80, 120)).save(os.path.join(folder, 'image.png'))
+    gtk = hasGtk()
+    for mode, (arguments, stdin, forbidden) in getModes(folder).items():
+      if mode == 'gui' and not gtk:
+        print('%-8s skipped (no GTK)' % mode)
+        continue
+      total, modules = measure(arguments, stdin, args.repeat)
+      results[mode] = total
+      line = '%-8s %8.1f ms  %4d modules' % (mode, total / 1000, len(modules))
+      loaded = getForbidden(modules, forbidden)
+      if len(loaded) > 0:
+        failed = True
+        line += '  imports ' + ', '.join(loaded)
+      if baseline is not None and mode in baseline:
+        change = total - baseline[mode]
+        line += '  (%+.1f%%)' % (change * 100 / baseline[mode])
+        if change > MIN_REGRESSION and change > baseline[mode] * args.threshold:
+          failed = True
+          line += '  REGRESSION'
+      print(line)
+  if args.save is not None:
+    with open(args.save, 'w') as hand:
+      json.dump(results, hand, indent=2)
+  sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+  main()
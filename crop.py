@@ -1,14 +1,100 @@
 #!/usr/bin/env python3
 
 import argparse
-from src import Interface
+import os
+import sys
 
 parser = argparse.ArgumentParser(description="Image crop")
-parser.add_argument( 'address', nargs='?', default=None, help = 'Image address' )
+parser.add_argument( 'address', nargs='*', help = 'Images or folders of images, browsed with Page Up/Page Down; - crops standard input to standard output' )
+parser.add_argument( '-b', '--batch', metavar='PATH', default=None, help = 'Crop every image in a folder or listed in a manifest, without the GUI' )
+parser.add_argument( '-r', '--ratio', default=None, help = 'Batch or filter crop ratio, e.g. 16:9' )
+parser.add_argument( '--box', default=None, help = 'Batch or filter crop box as x,y,width,height' )
+parser.add_argument( '-t', '--trim', action='store_true', help = 'Batch crop to the content, without the uniform borders' )
+parser.add_argument( '-s', '--smart', action='store_true', help = 'Batch crop the most detailed part of the image with the ratio' )
+parser.add_argument( '-f', '--format', default='png', choices=('png', 'same', 'lossless'), help = 'Batch or filter output format: png, same as the source, or lossless JPEG crop (default: png)' )
+parser.add_argument( '-q', '--quality', type=int, default=90, help = 'Batch or filter encoding quality for the same format output (default: 90)' )
+parser.add_argument( '--sizes', default=None, help = 'Batch output sizes (longest side), e.g. full,1920,1024,512,256' )
+parser.add_argument( '--serve', action='store_true', help = 'Run a crop server taking jobs on a Unix socket' )
+parser.add_argument( '--client', action='store_true', help = 'Send the images to the crop server with the batch options' )
+parser.add_argument( '--stop-server', action='store_true', help = 'Stop the crop server' )
+parser.add_argument( '--socket', default=None, help = 'Crop server socket (default: in $XDG_RUNTIME_DIR or /tmp)' )
+parser.add_argument( '--profile', metavar='FILE', default=None, help = 'Write stage timings and event rates as JSON on exit (or set IMAGE_CROP_PROFILE)' )
+parser.add_argument( '--cprofile', metavar='FILE', default=None, help = 'Also profile the main thread with cProfile (or set IMAGE_CROP_CPROFILE)' )
+parser.add_argument( '-j', '--jobs', type=int, default=None, help = 'Number of batch worker processes (default: all cores)' )
 
 args = parser.parse_args()
 
 address = args.address
 
-interface = Interface.start(address)
-interface.start()
+if args.profile is not None or args.cprofile is not None or 'IMAGE_CROP_PROFILE' in os.environ or 'IMAGE_CROP_CPROFILE' in os.environ:
+  # before anything else is imported: the timed functions are only
+  # wrapped when profiling is enabled
+  from src import Profiling
+  Profiling.setup(args.profile, args.cprofile)
+
+if args.serve:
+  from src import Server
+  try:
+    Server.serve(args.socket, args.jobs)
+  except (OSError, RuntimeError) as e:
+    sys.exit('crop.py: ' + str(e))
+elif args.client or args.stop_server:
+  # the client only sends the options, the server parses them
+  from src import Server
+  if args.trim:
+    auto = 'trim'
+  elif args.smart:
+    auto = 'smart'
+  else:
+    auto = None
+  try:
+    if args.stop_server:
+      Server.stopServer(args.socket)
+      success = True
+    else:
+      quality = str(args.quality)
+      success = Server.sendJobs(address, args.socket, box=args.box, ratio=args.ratio, auto=auto, format=args.format, quality=quality, sizes=args.sizes)
+  except OSError as e:
+    sys.exit('crop.py: cannot reach the crop server: ' + str(e))
+  sys.exit(0 if success else 1)
+elif args.batch is not None:
+  from src import Batch
+  try:
+    box = Batch.parseBox(args.box) if args.box is not None else None
+    ratio = Batch.parseRatio(args.ratio) if args.ratio is not None else None
+    sizes = Batch.parseSizes(args.sizes) if args.sizes is not None else None
+  except ValueError as e:
+    parser.error(str(e))
+  if args.smart and ratio is None:
+    parser.error('--smart needs a --ratio')
+  if not os.path.exists(args.batch):
+    parser.error('no such folder or manifest: ' + args.batch)
+  if args.trim:
+    auto = Batch.AUTO_TRIM
+  elif args.smart:
+    auto = Batch.AUTO_SMART
+  else:
+    auto = None
+  try:
+    success = Batch.start(args.batch, box, ratio, args.jobs, args.format, args.quality, auto, sizes)
+  except OSError as e:
+    sys.exit('crop.py: ' + str(e))
+  sys.exit(0 if success else 1)
+elif address == ['-']:
+  from src import Filter
+  from src.Batch import parseBox, parseRatio
+  try:
+    box = parseBox(args.box) if args.box is not None else None
+    ratio = parseRatio(args.ratio) if args.ratio is not None else None
+  except ValueError as e:
+    parser.error(str(e))
+  if box is None and ratio is None:
+    parser.error('the filter needs a --box or a --ratio')
+  try:
+    Filter.start(box, ratio, args.format, args.quality)
+  except Exception as e:
+    sys.exit('crop.py: ' + str(e))
+else:
+  from src import Interface
+  interface = Interface.start(address)
+  interface.start()
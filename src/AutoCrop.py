@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy
+
+from src import Crop
+from src.Geometry import getScaleFactor
+
+# largest side of the preview the content is searched on
+PREVIEW_SIZE = 512
+# largest difference from the background colour still seen as background
+TOLERANCE = 24
+# rows and columns with fewer content pixels are background (dust, noise)
+CONTENT_FRACTION = 0.005
+# preview pixels around each edge searched again at full resolution
+EDGE_MARGIN = 2
+# JPEG edges are searched again on a decode reduced by this (DCT scaling)
+JPEG_REFINE_SCALE = 2
+
+def toArray(image):
+  return numpy.asarray(image.convert('RGB'), dtype=numpy.int16)
+
+def getBackground(pixels):
+  # median colour of the four corners
+  corners = numpy.stack((pixels[0, 0], pixels[0, -1], pixels[-1, 0], pixels[-1, -1]))
+  return numpy.median(corners, axis=0)
+
+def getContentMask(pixels, background):
+  return numpy.abs(pixels - background).max(axis=2) > TOLERANCE
+
+def getExtent(mask, axis):
+  # first and last (exclusive) rows (axis 1) or columns (axis 0) with content
+  lines = numpy.flatnonzero(mask.mean(axis=axis) > CONTENT_FRACTION)
+  if len(lines) == 0:
+    return None
+  return int(lines[0]), int(lines[-1]) + 1
+
+def findContent(pixels, background):
+  # content box (left, top, right, bottom) of the pixels, None if blank
+  mask = getContentMask(pixels, background)
+  rows = getExtent(mask, 1)
+  columns = getExtent(mask, 0)
+  if rows is None or columns is None:
+    return None
+  return columns[0], rows[0], columns[1], rows[1]
+
+## TRIM
+def getEdgeStrips(box, size, margin):
+  # strips of the full resolution image around each edge of the box
+  width, height = size
+  left, top, right, bottom = box
+  return {'left': (max(left - margin, 0), top, min(left + margin, right), bottom),
+          'right': (max(right - margin, left), top, min(right + margin, width), bottom),
+          'top': (left, max(top - margin, 0), right, min(top + margin, bottom)),
+          'bottom': (left, max(bottom - margin, top), right, min(bottom + margin, height))}
+
+def openStrips(imagepath, strips, source=None):
+  if source is not None:
+    return {edge: source.crop(box) for edge, box in strips.items()}
+  # strips or tiles: each strip decodes only the tiles it covers
+  return {edge: Crop.openRegion(imagepath, box) for edge, box in strips.items()}
+
+def refineEdges(imagepath, box, size, margin, background, source=None):
+  left, top, right, bottom = box
+  strips = getEdgeStrips(box, size, margin)
+  strips = {edge: strip for edge, strip in strips.items() if strip[2] > strip[0] and strip[3] > strip[1]}
+  if len(strips) == 0:
+    return box
+  images = openStrips(imagepath, strips, source)
+  for edge, image in images.items():
+    strip_left, strip_top, _, _ = strips[edge]
+    mask = getContentMask(toArray(image), background)
+    if edge in ('left', 'right'):
+      extent = getExtent(mask, 0)
+    else:
+      extent = getExtent(mask, 1)
+    if extent is None:
+      continue
+    if edge == 'left':
+      left = strip_left + extent[0]
+    elif edge == 'right':
+      right = strip_left + extent[1]
+    elif edge == 'top':
+      top = strip_top + extent[0]
+    else:
+      bottom = strip_top + extent[1]
+  return left, top, max(right, left + 1), max(bottom, top + 1)
+
+def refineReduced(box, size, margin, background, source):
+  # refineEdges on a reduced decode of the whole image, rounding outwards
+  width, height = size
+  factor = source.size[0] / width
+  left, top, right, bottom = box
+  reduced_box = (int(left * factor), int(top * factor),
+                 min(int(math.ceil(right * factor)), source.size[0]), min(int(math.ceil(bottom * factor)), source.size[1]))
+  reduced_margin = int(math.ceil(margin * factor))
+  left, top, right, bottom = refineEdges(None, reduced_box, source.size, reduced_margin, background, source)
+  return (int(left / factor), int(top / factor),
+          min(int(math.ceil(right / factor)), width), min(int(math.ceil(bottom / factor)), height))
+
+def findContentBox(imagepath, preview=None):
+  # box (left, top, right, bottom) of the image without its uniform
+  # borders, None for a blank image; preview is (image, scale factor)
+  # when the caller has already decoded one
+  with Crop.openSource(imagepath) as image:
+    size = image.size
+    jpeg = image.format == 'JPEG'
+    decode_once = not jpeg and len(image.tile) <= 1
+  source = None
+  if decode_once:
+    # neither the preview nor the strips can be decoded on their own
+    source = Crop.openImage(imagepath)
+  elif jpeg:
+    # the bottom and side edges need the rows above them decoded anyway:
+    # decode every row once, reduced with DCT scaling (the edges are then
+    # found to a few source pixels, rounding outwards)
+    source = Crop.openRegion(imagepath, (0, 0) + size, JPEG_REFINE_SCALE)
+  if preview is None and source is not None:
+    factor = getScaleFactor(size[0], size[1], PREVIEW_SIZE, PREVIEW_SIZE)
+    image = source.reduce(max(int(source.size[0] / size[0] / factor), 1))
+    preview = image, image.size[0] / size[0]
+  elif preview is None:
+    preview = Crop.openPreview(imagepath, PREVIEW_SIZE, PREVIEW_SIZE)
+  image, factor = preview
+  pixels = toArray(image)
+  background = getBackground(pixels)
+  content = findContent(pixels, background)
+  if content is None:
+    return None
+  # back to full resolution, rounding outwards
+  width, height = size
+  left, top, right, bottom = content
+  box = (int(left / factor), int(top / factor),
+         min(int(math.ceil(right / factor)), width), min(int(math.ceil(bottom / factor)), height))
+  if factor < 1:
+    # the preview edges are only accurate to a few source pixels
+    margin = int(math.ceil(EDGE_MARGIN / factor))
+    if source is not None and source.size != size:
+      box = refineReduced(box, size, margin, background, source)
+    else:
+      box = refineEdges(imagepath, box, size, margin, background, source)
+  return box
+
+## SMART CROP
+def getEnergy(pixels):
+  # gradient magnitude of the luminance
+  gray = pixels.mean(axis=2, dtype=numpy.float32)
+  energy = numpy.zeros(gray.shape, dtype=numpy.float32)
+  energy[:, 1:] += numpy.abs(numpy.diff(gray, axis=1))
+  energy[1:, :] += numpy.abs(numpy.diff(gray, axis=0))
+  return energy
+
+def getIntegral(values):
+  # summed-area table, with a zero row and column in front
+  integral = numpy.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=numpy.float64)
+  integral[1:, 1:] = values.cumsum(axis=0, dtype=numpy.float64).cumsum(axis=1)
+  return integral
+
+def getWindowSums(integral, width, height):
+  # sum inside every width x height window, indexed by its top left corner
+  return (integral[height:, width:] - integral[:-height, width:]
+          - integral[height:, :-width] + integral[:-height, :-width])
+
+def findBestWindow(values, width, height):
+  # top left corner of the window holding the most; ties go to the
+  # window closest to the centre
+  sums = getWindowSums(getIntegral(values), width, height)
+  best = sums.max()
+  rows, columns = numpy.nonzero(sums >= best - abs(best) * 1e-9)
+  centre_y, centre_x = (sums.shape[0] - 1) / 2, (sums.shape[1] - 1) / 2
+  index = numpy.argmin((rows - centre_y) ** 2 + (columns - centre_x) ** 2)
+  return int(columns[index]), int(rows[index])
+
+def findSmartBox(imagepath, size, preview=None):
+  # box (left, top, right, bottom) of the given size on the part of the
+  # image with the most detail; preview is (image, scale factor)
+  with Crop.openSource(imagepath) as image:
+    image_width, image_height = image.size
+  if preview is None:
+    preview = Crop.openPreview(imagepath, PREVIEW_SIZE, PREVIEW_SIZE)
+  image, factor = preview
+  energy = getEnergy(toArray(image))
+  preview_height, preview_width = energy.shape
+  width = min(int(size[0]), image_width)
+  height = min(int(size[1]), image_height)
+  window_width = min(max(int(round(width * factor)), 1), preview_width)
+  window_height = min(max(int(round(height * factor)), 1), preview_height)
+  x, y = findBestWindow(energy, window_width, window_height)
+  left = min(max(int(round(x / factor)), 0), image_width - width)
+  top = min(max(int(round(y / factor)), 0), image_height - height)
+  return left, top, left + width, top + height
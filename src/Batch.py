@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+from collections import OrderedDict
+from fractions import Fraction
+from itertools import islice
+
+from src import Crop
+from src import Naming
+from src import Profiling
+from src.Geometry import CropBox, fitBoxes
+
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.pgm', '.ppm', '.tif', '.tiff', '.webp', '.gray', '.rgb', '.rgba')
+
+# groups of jobs handed to the worker pool at once
+POOL_WINDOW = 1024
+
+# automatic crops
+AUTO_TRIM = 'trim'
+AUTO_SMART = 'smart'
+
+## PARSING
+def parseRatio(text):
+  # errors name the value, as they end up in command line and manifest
+  # messages
+  text = str(text)
+  try:
+    ratio_width, ratio_height = text.split(':')
+    # exact: 1.5 is 3/2, not a float
+    ratio_width = Fraction(ratio_width)
+    ratio_height = Fraction(ratio_height)
+  except (ValueError, ZeroDivisionError):
+    raise ValueError('Invalid ratio (width:height): ' + text)
+  if ratio_width <= 0 or ratio_height <= 0:
+    raise ValueError('Invalid ratio: ' + text)
+  return ratio_width, ratio_height
+
+def parseBox(text):
+  text = str(text)
+  try:
+    x, y, width, height = [int(value) for value in text.split(',')]
+  except ValueError:
+    raise ValueError('Invalid box (x,y,width,height): ' + text)
+  if width <= 0 or height <= 0:
+    raise ValueError('Invalid box: ' + text)
+  return x, y, width, height
+
+def parseSizes(text):
+  # comma separated longest sides, 'full' for the crop itself
+  sizes = []
+  for value in text.split(','):
+    value = value.strip()
+    if value == 'full':
+      sizes.append(None)
+    elif value.isdigit() and int(value) > 0:
+      sizes.append(int(value))
+    else:
+      raise ValueError('Invalid size: ' + value)
+  if len(sizes) == 0:
+    raise ValueError('Missing sizes')
+  return sizes
+
+def parseSpec(text):
+  # a spec is either a box (x,y,width,height) or a ratio (width:height)
+  if ':' in text:
+    return None, parseRatio(text)
+  else:
+    return parseBox(text), None
+
+def isImage(path):
+  basename, extension = os.path.splitext(path)
+  # skip the output of previous runs
+  if Naming.OUTPUT_SUFFIX in os.path.basename(basename):
+    return False
+  return extension.lower() in IMAGE_EXTENSIONS
+
+## JOBS
+def makeJob(path, box=None, ratio=None, auto=None, output=None):
+  # output: path of the crop, next free name.resized[-n].ext if None
+  return {'path': path, 'box': box, 'ratio': ratio, 'auto': auto, 'output': output}
+
+def listFolder(folder, box=None, ratio=None, auto=None):
+  jobs = []
+  for name in sorted(os.listdir(folder)):
+    path = os.path.join(folder, name)
+    if os.path.isfile(path) and isImage(path):
+      jobs.append(makeJob(path, box, ratio, auto))
+  return jobs
+
+def readManifest(manifest, box=None, ratio=None, auto=None):
+  # one entry per line: path [box|ratio]
+  jobs = []
+  folder = os.path.dirname(os.path.abspath(manifest))
+  with open(manifest, 'r') as hand:
+    for line in hand:
+      line = line.strip()
+      if line == '' or line.startswith('#'):
+        continue
+      path = line
+      job_box, job_ratio, job_auto = box, ratio, auto
+      parts = line.rsplit(None, 1)
+      if len(parts) == 2:
+        try:
+          job_box, job_ratio = parseSpec(parts[1])
+          job_auto = None
+          path = parts[0]
+        except ValueError:
+          pass
+      if not os.path.isabs(path):
+        path = os.path.join(folder, path)
+      jobs.append(makeJob(path, job_box, job_ratio, job_auto))
+  return jobs
+
+def loadJobs(address, box=None, ratio=None, auto=None):
+  if os.path.isdir(address):
+    return listFolder(address, box, ratio, auto)
+  else:
+    return readManifest(address, box, ratio, auto)
+
+def groupJobs(jobs):
+  # all the crops of a source run on the same worker, so that it is
+  # decoded once and kept in the decoded image cache
+  groups = OrderedDict()
+  for job in jobs:
+    groups.setdefault(job['path'], []).append(job)
+  return list(groups.values())
+
+## CROP
+def getCropBox(size, box=None, ratio=None):
+  width, height = size
+  crop_box = CropBox(width, height)
+  crop_box.setSizeMin(1)
+  if box is not None:
+    crop_box.fixRatio(False)
+    crop_box.clampTo(*box)
+  elif ratio is not None:
+    crop_box.setRatio(*ratio)
+    crop_box.fitCentered()
+  else:
+    raise ValueError('Missing crop box or ratio')
+  x, y, width, height = crop_box.getBox()
+  return int(x), int(y), int(x + width), int(y + height)
+
+def getImageSizes(paths):
+  # only the headers are read; None for the files that can't be opened
+  sizes = []
+  for path in paths:
+    try:
+      with Crop.openSource(path) as image:
+        sizes.append(image.size)
+    except Exception:
+      sizes.append(None)
+  return sizes
+
+def applyBox(paths, normalized_box, ratio=None, output_format=Crop.FORMAT_PNG, quality=Crop.DEFAULT_QUALITY, workers=None, callback=None):
+  # crop the same relative box out of every image on a thread pool (PIL
+  # releases the GIL while decoding and encoding);
+  # callback(done, total, failed) is called from the calling thread
+  from concurrent.futures import ThreadPoolExecutor, as_completed
+  sizes = getImageSizes(paths)
+  valid = [i for i in range(len(paths)) if sizes[i] is not None]
+  boxes = fitBoxes(normalized_box, [sizes[i] for i in valid], ratio) if len(valid) > 0 else []
+  total = len(paths)
+  failed = total - len(valid)
+  done = failed
+  if callback is not None:
+    callback(done, total, failed)
+  results = []
+  with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+    futures = {}
+    for i, box in zip(valid, boxes):
+      future = executor.submit(Crop.saveCrop, paths[i], box, output_format, quality, None)
+      futures[future] = paths[i]
+    for future in as_completed(futures):
+      try:
+        results.append((futures[future], future.result()))
+      except Exception:
+        failed += 1
+      done += 1
+      if callback is not None:
+        callback(done, total, failed)
+  return results
+
+def cropJob(job, cache=None):
+  start = time.perf_counter()
+  try:
+    if job['auto'] is not None:
+      from src import AutoCrop
+    if job['auto'] == AUTO_TRIM:
+      box = AutoCrop.findContentBox(job['path'])
+      if box is None:
+        raise ValueError('No content found')
+    else:
+      with Crop.openSource(job['path']) as image:
+        size = image.size
+      box = getCropBox(size, job['box'], job['ratio'])
+      if job['auto'] == AUTO_SMART:
+        # the largest box with the ratio, moved to the most detailed part
+        left, top, right, bottom = box
+        box = AutoCrop.findSmartBox(job['path'], (right - left, bottom - top))
+    if job['sizes'] is None:
+      savepaths = [Crop.saveCrop(job['path'], box, job['format'], job['quality'], cache, job['output'])]
+    else:
+      savepaths = Crop.saveLadder(job['path'], box, job['sizes'], job['format'], job['quality'], cache, job['output'])
+    error = None
+  except Exception as e:
+    savepaths = None
+    error = str(e)
+  elapsed = time.perf_counter() - start
+  return job['path'], savepaths, elapsed, error
+
+def cropGroup(jobs):
+  # (job, result) for each job; single crops only decode the region they need
+  cache = Crop.IMAGE_CACHE if len(jobs) > 1 else None
+  results = [(job, cropJob(job, cache)) for job in jobs]
+  if cache is not None:
+    cache.clear()
+  return results
+
+def setOutput(jobs, output_format, quality, sizes=None):
+  for job in jobs:
+    job['format'] = output_format
+    job['quality'] = quality
+    job['sizes'] = sizes
+  return jobs
+
+def getWindows(groups, size=POOL_WINDOW):
+  # the groups are read lazily, a window at a time, so that long
+  # manifests are never held in memory
+  groups = iter(groups)
+  while True:
+    window = list(islice(groups, size))
+    if len(window) == 0:
+      break
+    yield window
+
+def run(groups, workers=None, output=sys.stdout, journal=None):
+  # imported here: the GUI and the filter never start worker processes
+  from multiprocessing import Pool
+  start = time.perf_counter()
+  done = 0
+  failed = 0
+  with Pool(workers) as pool:
+    for window in getWindows(groups):
+      for results in pool.imap_unordered(cropGroup, window):
+        for job, (path, savepaths, elapsed, error) in results:
+          # the workers are other processes: only their job times are profiled
+          Profiling.record('batch.job', elapsed)
+          if error is None:
+            done += 1
+            savenames = ', '.join([os.path.basename(savepath) for savepath in savepaths])
+            output.write('%s -> %s (%.1f ms)\n' % (path, savenames, elapsed * 1000))
+            if journal is not None:
+              journal.record(job, savepaths)
+          else:
+            failed += 1
+            output.write('%s: ERROR %s (%.1f ms)\n' % (path, error, elapsed * 1000))
+  total = time.perf_counter() - start
+  rate = done / total if total > 0 else 0
+  output.write('Cropped %d images (%d failed) in %.2f s: %.1f images/s\n' % (done, failed, total, rate))
+  return failed == 0
+
+def start(address, box=None, ratio=None, workers=None, output_format=Crop.FORMAT_PNG, quality=Crop.DEFAULT_QUALITY, auto=None, sizes=None):
+  from src import Manifest
+  if Manifest.isManifest(address):
+    defaults = makeJob(None, box, ratio, auto)
+    setOutput([defaults], output_format, quality, sizes)
+    return Manifest.start(address, defaults, workers)
+  jobs = loadJobs(address, box, ratio, auto)
+  setOutput(jobs, output_format, quality, sizes)
+  return run(groupJobs(jobs), workers)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+def getImageBytes(size, mode):
+  # PIL stores multi-band images with 4 bytes per pixel
+  width, height = size
+  if mode in ('1', 'L', 'P'):
+    return width * height
+  else:
+    return width * height * 4
+
+## IMAGE CACHE
+# Decoded images keyed on path, modification time and file size, evicted
+# least recently used first when over the memory budget.
+class ImageCache():
+
+  def __init__(self, max_bytes=DEFAULT_CACHE_SIZE):
+    self.max_bytes = max_bytes
+    self.size = 0
+    self.images = OrderedDict()
+    self.lock = threading.Lock()
+
+  def getKey(self, imagepath):
+    stat = os.stat(imagepath)
+    return os.path.abspath(imagepath), stat.st_mtime_ns, stat.st_size
+
+  def fits(self, size, mode):
+    return getImageBytes(size, mode) <= self.max_bytes
+
+  def get(self, imagepath):
+    key = self.getKey(imagepath)
+    with self.lock:
+      image = self.images.get(key)
+      if image is not None:
+        self.images.move_to_end(key)
+      return image
+
+  def put(self, imagepath, image):
+    key = self.getKey(imagepath)
+    image_bytes = getImageBytes(image.size, image.mode)
+    if image_bytes > self.max_bytes:
+      return
+    with self.lock:
+      if key in self.images:
+        old = self.images.pop(key)
+        self.size -= getImageBytes(old.size, old.mode)
+      self.images[key] = image
+      self.size += image_bytes
+      self.evict()
+
+  def evict(self):
+    while self.size > self.max_bytes and len(self.images) > 0:
+      _, image = self.images.popitem(last=False)
+      self.size -= getImageBytes(image.size, image.mode)
+
+  def setMaxBytes(self, max_bytes):
+    with self.lock:
+      self.max_bytes = max_bytes
+      self.evict()
+
+  def clear(self):
+    with self.lock:
+      self.images.clear()
+      self.size = 0
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import shutil
+import subprocess
+
+from PIL import Image
+
+from src import Cache
+from src import Mapped
+from src import Naming
+from src import Profiling
+from src.Geometry import getScaleFactor
+
+OUTPUT_EXTENSION = '.png'
+
+FORMAT_PNG = 'png'
+FORMAT_SAME = 'same'
+FORMAT_LOSSLESS = 'lossless'
+OUTPUT_FORMATS = (FORMAT_PNG, FORMAT_SAME, FORMAT_LOSSLESS)
+
+DEFAULT_QUALITY = 90
+
+JPEGTRAN = 'jpegtran'
+
+# encoders running at once for the sizes of a crop
+LADDER_THREADS = 4
+# modes Image.reduce works with
+REDUCE_MODES = ('L', 'LA', 'I', 'F', 'RGB', 'RGBA', 'CMYK', 'YCbCr')
+
+# decoded sources shared by all the crops of this process
+IMAGE_CACHE = Cache.ImageCache()
+
+JPEG_MCU_SIZE = 16
+JPEG_SOF_MARKERS = (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+
+## IMAGE OPERATIONS
+def openSource(imagepath):
+  # Image.open, and raw dumps, which have no header for it to recognise
+  if Mapped.isRawDump(imagepath):
+    return Mapped.RawImageFile(imagepath)
+  return Image.open(imagepath)
+
+@Profiling.timed('crop.decode')
+def openImage(imagepath):
+  image = openSource(imagepath)
+  image.load()
+  return image
+
+def cropImage(imagepath, box, cache=IMAGE_CACHE):
+  # with a cache, the source is decoded once and every crop reuses it;
+  # sources larger than the cache go through openRegion, and uncompressed
+  # ones are mapped rather than cached (the page cache keeps them)
+  if cache is None:
+    return openRegion(imagepath, box)
+  image = cache.get(imagepath)
+  if image is None:
+    with openSource(imagepath) as header:
+      size, mode = header.size, header.mode
+      layout = Mapped.getLayout(header)
+    if layout is not None or not cache.fits(size, mode):
+      return openRegion(imagepath, box)
+    image = openImage(imagepath)
+    cache.put(imagepath, image)
+  with Profiling.timer('crop.crop'):
+    return image.crop(box)
+
+@Profiling.timed('crop.decode_region')
+def openRegion(imagepath, box, reduce=1):
+  # decode only the part of the file covering the box when the format
+  # allows it, otherwise decode everything and crop; JPEG sources can be
+  # decoded up to reduce times smaller with DCT scaling, the result is
+  # then smaller than the box
+  image = openSource(imagepath)
+  width, height = image.size
+  left, top, right, bottom = box
+  layout = Mapped.getLayout(image)
+  if layout is not None and Mapped.containsBox(image.size, box):
+    # uncompressed: copy the box out of the mapped file
+    image.close()
+    return Mapped.cropMapped(imagepath, (width, height), layout, box)
+  if len(image.tile) > 1:
+    # strips or tiles: keep only the ones overlapping the box (only
+    # formats PIL decodes itself have several; compressed TIFFs, tiled or
+    # not, are a single libtiff tile and decoded whole below)
+    tiles = [tile for tile in image.tile if overlapsBox(tile[1], box)]
+    if len(tiles) > 0:
+      region_left = min([tile[1][0] for tile in tiles])
+      region_top = min([tile[1][1] for tile in tiles])
+      region_right = max([tile[1][2] for tile in tiles])
+      region_bottom = max([tile[1][3] for tile in tiles])
+      image.tile = [shiftTile(tile, region_left, region_top) for tile in tiles]
+      image._size = (region_right - region_left, region_bottom - region_top)
+      image.load()
+      return image.crop((left - region_left, top - region_top, right - region_left, bottom - region_top))
+  elif image.format == 'JPEG':
+    # scanlines are decoded top to bottom: declare the image as tall as
+    # the bottom of the box so that libjpeg stops there (one more MCU row
+    # keeps the chroma upsampling of the last rows unchanged); every row
+    # above the box is still decoded at full width, so time and memory
+    # follow the bottom of the box, not its size, and a box at the bottom
+    # costs a full decode
+    rows = (int(math.ceil(bottom / JPEG_MCU_SIZE)) + 1) * JPEG_MCU_SIZE
+    hand = None
+    if rows < height:
+      image.close()
+      hand = JpegRowsFile(imagepath, rows)
+      image = Image.open(hand)
+    else:
+      rows = height
+    try:
+      if reduce > 1:
+        image.draft(image.mode, (int(math.ceil(width / reduce)), int(math.ceil(rows / reduce))))
+      image.load()
+    finally:
+      if hand is not None:
+        hand.close()
+    factor = width / image.size[0]
+    return image.crop((int(left / factor), int(top / factor), int(math.ceil(right / factor)), int(math.ceil(bottom / factor))))
+  image.load()
+  return image.crop(box)
+
+def overlapsBox(extents, box):
+  left, top, right, bottom = extents
+  return left < box[2] and right > box[0] and top < box[3] and bottom > box[1]
+
+def shiftTile(tile, delta_x, delta_y):
+  left, top, right, bottom = tile[1]
+  extents = (left - delta_x, top - delta_y, right - delta_x, bottom - delta_y)
+  return replaceExtents(tile, extents)
+
+def replaceExtents(tile, extents):
+  # recent PIL versions use named tuples for tiles
+  if hasattr(tile, '_replace'):
+    return tile._replace(extents=extents)
+  return (tile[0], extents) + tuple(tile[2:])
+
+def openPreview(imagepath, max_width, max_height):
+  # JPEG images are decoded at a reduced size using DCT scaling
+  image = openSource(imagepath)
+  width, height = image.size
+  factor = getScaleFactor(width, height, max_width, max_height)
+  new_size = (max(int(width * factor), 1), max(int(height * factor), 1))
+  if image.format == 'JPEG':
+    image.draft('RGB', new_size)
+  image.load()
+  if image.size != new_size:
+    image = image.resize(new_size, Image.BILINEAR)
+  return image, factor
+
+## JPEG
+class JpegRowsFile():
+  # read-only file that reports a different image height in the SOF header
+
+  def __init__(self, imagepath, rows):
+    self.hand = open(imagepath, 'rb')
+    self.height_offset = findJpegHeightOffset(self.hand)
+    self.height_bytes = bytes(((rows >> 8) & 0xFF, rows & 0xFF))
+    self.hand.seek(0)
+
+  def read(self, size=-1):
+    position = self.hand.tell()
+    data = self.hand.read(size)
+    start = self.height_offset - position
+    if start + 2 > 0 and start < len(data):
+      patched = bytearray(data)
+      for i in range(2):
+        if 0 <= start + i < len(data):
+          patched[start + i] = self.height_bytes[i]
+      data = bytes(patched)
+    return data
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    return self.hand.seek(offset, whence)
+
+  def tell(self):
+    return self.hand.tell()
+
+  def close(self):
+    self.hand.close()
+
+def findJpegHeightOffset(hand):
+  hand.seek(2)
+  while True:
+    data = hand.read(1)
+    if data == b'':
+      raise ValueError('JPEG frame header not found')
+    if data != b'\xff':
+      continue
+    marker = hand.read(1)
+    while marker == b'\xff':
+      marker = hand.read(1)
+    marker = marker[0]
+    if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+      # markers without a payload
+      continue
+    start = hand.tell()
+    length = int.from_bytes(hand.read(2), 'big')
+    if marker in JPEG_SOF_MARKERS:
+      # length (2 bytes), precision (1 byte), height (2 bytes)
+      return start + 3
+    hand.seek(start + length)
+
+## OUTPUT
+def getEncoding(imagepath, output_format=FORMAT_PNG, quality=DEFAULT_QUALITY):
+  # PIL format, file extension and save options of the output
+  if output_format == FORMAT_PNG:
+    return 'PNG', OUTPUT_EXTENSION, {}
+  # re-encode in the same format as the source
+  _, extension = os.path.splitext(imagepath)
+  with openSource(imagepath) as image:
+    image_format = image.format
+  if not image_format in Image.SAVE:
+    # raw dumps are read only
+    return 'PNG', OUTPUT_EXTENSION, {}
+  return image_format, extension, {'quality': quality}
+
+def claimOutput(imagepath, extension, savepath=None):
+  # next free name.resized[-n].ext, or the given output path
+  if savepath is None:
+    return Naming.claimSavePath(imagepath, extension)
+  return Naming.claimPath(savepath)
+
+def saveImage(imagepath, image, extension, image_format, options, savepath=None):
+  savepath = claimOutput(imagepath, extension, savepath)
+  with Profiling.timer('crop.encode'):
+    Naming.writeAtomic(savepath, lambda path: image.save(path, format=image_format, **options))
+  return savepath
+
+@Profiling.timed('crop.save')
+def saveCrop(imagepath, box, output_format=FORMAT_PNG, quality=DEFAULT_QUALITY, cache=IMAGE_CACHE, savepath=None):
+  if output_format == FORMAT_LOSSLESS and canCropLossless(imagepath):
+    _, extension = os.path.splitext(imagepath)
+    return saveLossless(imagepath, box, extension, savepath)
+  new_img = cropImage(imagepath, box, cache)
+  image_format, extension, options = getEncoding(imagepath, output_format, quality)
+  return saveImage(imagepath, new_img, extension, image_format, options, savepath)
+
+def saveLossless(imagepath, box, extension, savepath=None):
+  savepath = claimOutput(imagepath, extension, savepath)
+  Naming.writeAtomic(savepath, lambda path: cropJpegLossless(imagepath, box, path))
+  return savepath
+
+## LADDER
+def getSizeExtension(size, extension):
+  # name.resized.512px.png
+  return '.' + str(size) + 'px' + extension
+
+def getLadderSizes(image_size, sizes):
+  # (size, pixel size) of each size, largest first, None for the full
+  # crop: sizes larger than the crop are not upscaled and the same pixel
+  # size is only kept once
+  width, height = image_size
+  longest = max(width, height)
+  ladder = []
+  kept = set()
+  for size in sorted(set(sizes), key=lambda size: -math.inf if size is None else -size):
+    if size is None or size >= longest:
+      target = (width, height)
+    else:
+      factor = size / longest
+      target = (max(int(round(width * factor)), 1), max(int(round(height * factor)), 1))
+    if target in kept:
+      continue
+    kept.add(target)
+    ladder.append((size, target))
+  return ladder
+
+def buildLadder(image, sizes):
+  # (size, image) for each of getLadderSizes: successive halvings then a
+  # single resize from less than twice the size
+  ladder = []
+  current = image
+  for size, target in getLadderSizes(image.size, sizes):
+    if target == image.size:
+      variant = image
+    else:
+      if not current.mode in REDUCE_MODES:
+        current = current.convert('RGBA' if 'transparency' in current.info else 'RGB')
+      while current.size[0] >= target[0] * 2 and current.size[1] >= target[1] * 2:
+        current = current.reduce(2)
+      variant = current.resize(target, Image.LANCZOS) if current.size != target else current
+    ladder.append((size, variant))
+  return ladder
+
+def getLadderExtensions(ladder, extension):
+  # name.resized.png, name.resized.512px.png, ...
+  return [extension if size is None else getSizeExtension(size, extension) for size, _ in ladder]
+
+def getSizePath(savepath, size):
+  # out.jpg -> out.512px.jpg
+  root, extension = os.path.splitext(savepath)
+  return root + getSizeExtension(size, extension)
+
+@Profiling.timed('crop.save_ladder')
+def saveLadder(imagepath, box, sizes, output_format=FORMAT_PNG, quality=DEFAULT_QUALITY, cache=IMAGE_CACHE, savepath=None):
+  # the source is decoded and cropped once, the sizes are encoded in
+  # parallel; returns the paths from the largest size to the smallest;
+  # with a savepath, the smaller sizes are saved next to it
+  from concurrent.futures import ThreadPoolExecutor
+  lossless = output_format == FORMAT_LOSSLESS and canCropLossless(imagepath)
+  if lossless:
+    # only the full size can be lossless, the others are JPEG
+    output_format = FORMAT_SAME
+  image_format, extension, options = getEncoding(imagepath, output_format, quality)
+  new_img = cropImage(imagepath, box, cache)
+  new_img.load()
+  ladder = buildLadder(new_img, sizes)
+  if savepath is None:
+    # the same index for every size: name.resized-2.png, name.resized-2.512px.png
+    savepaths = Naming.claimSavePaths(imagepath, getLadderExtensions(ladder, extension))
+  else:
+    savepaths = [savepath if size is None else getSizePath(savepath, size) for size, _ in ladder]
+  jobs = []
+  for (size, variant), size_path in zip(ladder, savepaths):
+    if size is None and lossless:
+      jobs.append((saveLossless, imagepath, box, extension, size_path))
+    else:
+      jobs.append((saveImage, imagepath, variant, extension, image_format, options, size_path))
+  with ThreadPoolExecutor(LADDER_THREADS) as executor:
+    futures = [executor.submit(*job) for job in jobs]
+    return [future.result() for future in futures]
+
+## REGIONS
+def getRegionExtension(name, extension):
+  # name.resized.<region>.png
+  return '.' + name + extension
+
+def getUnion(boxes):
+  return (min([box[0] for box in boxes]), min([box[1] for box in boxes]),
+          max([box[2] for box in boxes]), max([box[3] for box in boxes]))
+
+def openRegions(imagepath, boxes, cache=IMAGE_CACHE):
+  # the crops of several boxes out of a single decode: of the whole
+  # source when it fits the cache, of the union of the boxes otherwise;
+  # mapped sources are not decoded at all
+  with openSource(imagepath) as header:
+    size, mode = header.size, header.mode
+    layout = Mapped.getLayout(header)
+  if layout is not None:
+    return [openRegion(imagepath, box) for box in boxes]
+  if cache is not None and cache.fits(size, mode):
+    return [cropImage(imagepath, box, cache) for box in boxes]
+  left, top, right, bottom = getUnion(boxes)
+  source = openRegion(imagepath, (left, top, right, bottom))
+  return [source.crop((box[0] - left, box[1] - top, box[2] - left, box[3] - top)) for box in boxes]
+
+def saveRegion(imagepath, box, image, sizes, savepaths, encoding, lossless):
+  # one region at each size, to the claimed savepaths; image is None when
+  # the region is only cropped losslessly
+  image_format, extension, options = encoding
+  if image is None:
+    return [saveLossless(imagepath, box, extension, savepaths[0])]
+  for (size, variant), savepath in zip(buildLadder(image, sizes), savepaths):
+    if size is None and lossless:
+      saveLossless(imagepath, box, extension, savepath)
+    else:
+      saveImage(imagepath, variant, extension, image_format, options, savepath)
+  return savepaths
+
+@Profiling.timed('crop.save_regions')
+def saveRegions(imagepath, regions, output_format=FORMAT_PNG, quality=DEFAULT_QUALITY, sizes=None, cache=IMAGE_CACHE, workers=None):
+  # regions: (name, box) pairs cropped out of one decode of the source
+  # and encoded in parallel (PIL releases the GIL while encoding), all
+  # with the same index: name.resized-2.<region>[.512px].png; returns the
+  # paths, region by region
+  from concurrent.futures import ThreadPoolExecutor
+  names = [name for name, _ in regions]
+  if len(set(names)) != len(names):
+    raise ValueError('Region names must be unique')
+  sizes = sizes or [None]
+  lossless = output_format == FORMAT_LOSSLESS and canCropLossless(imagepath)
+  if lossless:
+    # only the full size can be lossless, the others are JPEG
+    output_format = FORMAT_SAME
+  encoding = getEncoding(imagepath, output_format, quality)
+  extension = encoding[1]
+  # the sizes of each region are known from its box, so that every name
+  # is claimed at once
+  extensions = []
+  counts = []
+  for name, box in regions:
+    ladder = getLadderSizes((box[2] - box[0], box[3] - box[1]), sizes)
+    extensions.extend([getRegionExtension(name, size_extension) for size_extension in getLadderExtensions(ladder, extension)])
+    counts.append(len(ladder))
+  claimed = Naming.claimSavePaths(imagepath, extensions)
+  boxes = [box for _, box in regions]
+  if lossless and sizes == [None]:
+    # jpegtran reads the source itself
+    images = [None] * len(regions)
+  else:
+    images = openRegions(imagepath, boxes, cache)
+  with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+    futures = []
+    start = 0
+    for box, image, count in zip(boxes, images, counts):
+      savepaths = claimed[start:start + count]
+      start += count
+      futures.append(executor.submit(saveRegion, imagepath, box, image, sizes, savepaths, encoding, lossless))
+    return [savepath for future in futures for savepath in future.result()]
+
+## LOSSLESS JPEG
+def canCropLossless(imagepath):
+  if shutil.which(JPEGTRAN) is None:
+    return False
+  with openSource(imagepath) as image:
+    return image.format == 'JPEG'
+
+def getJpegMcuSize(image):
+  # the MCU is 8x8 pixels for each sampling factor of the largest component
+  h_factor = max([layer[1] for layer in image.layer])
+  v_factor = max([layer[2] for layer in image.layer])
+  return 8 * h_factor, 8 * v_factor
+
+def snapToMcu(box, mcu_size):
+  # move the top left corner back to the MCU grid, keep the bottom right one
+  left, top, right, bottom = box
+  mcu_width, mcu_height = mcu_size
+  left = left - left % mcu_width
+  top = top - top % mcu_height
+  return left, top, right, bottom
+
+def runJpegtran(source, image, box, savepath=None):
+  # source is the path or the bytes of the JPEG opened as image; jpegtran
+  # reads and writes pipes too, so without savepath the crop is returned
+  # as bytes
+  left, top, right, bottom = snapToMcu(box, getJpegMcuSize(image))
+  width, height = image.size
+  right = min(right, width)
+  bottom = min(bottom, height)
+  crop = '%dx%d+%d+%d' % (right - left, bottom - top, left, top)
+  command = [JPEGTRAN, '-copy', 'all', '-crop', crop]
+  if savepath is not None:
+    command += ['-outfile', savepath]
+  data = None
+  if isinstance(source, bytes):
+    data = source
+  else:
+    command.append(source)
+  stdout = subprocess.PIPE if savepath is None else subprocess.DEVNULL
+  result = subprocess.run(command, input=data, check=True, stdout=stdout, stderr=subprocess.PIPE)
+  return (left, top, right, bottom), result.stdout
+
+@Profiling.timed('crop.lossless')
+def cropJpegLossless(imagepath, box, savepath):
+  with Image.open(imagepath) as image:
+    crop_box, _ = runJpegtran(imagepath, image, box, savepath)
+  return crop_box
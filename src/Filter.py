@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import io
+import shutil
+import sys
+
+from PIL import Image
+
+from src import Crop
+from src import Profiling
+from src.Batch import getCropBox
+
+## FILTER
+# Image bytes on stdin, encoded crop on stdout, nothing on disk: only PIL
+# is imported, so that each invocation in a pipeline starts fast.
+
+def readImage(stream):
+  # PIL needs to seek, so the whole input is kept in memory
+  data = stream.read()
+  if len(data) == 0:
+    raise ValueError('No image on standard input')
+  return data, Image.open(io.BytesIO(data))
+
+def encodeCrop(data, image, box, output_format=Crop.FORMAT_PNG, quality=Crop.DEFAULT_QUALITY):
+  if output_format == Crop.FORMAT_LOSSLESS and image.format == 'JPEG' and shutil.which(Crop.JPEGTRAN) is not None:
+    _, output = Crop.runJpegtran(data, image, box)
+    return output
+  if output_format == Crop.FORMAT_PNG:
+    image_format = 'PNG'
+    options = {}
+  else:
+    # re-encode in the same format as the source
+    image_format = image.format
+    options = {'quality': quality}
+  output = io.BytesIO()
+  with Profiling.timer('filter.decode_crop'):
+    new_img = image.crop(box)
+  with Profiling.timer('filter.encode'):
+    new_img.save(output, format=image_format, **options)
+  return output.getvalue()
+
+def start(box=None, ratio=None, output_format=Crop.FORMAT_PNG, quality=Crop.DEFAULT_QUALITY, stdin=None, stdout=None):
+  stdin = stdin if stdin is not None else sys.stdin.buffer
+  stdout = stdout if stdout is not None else sys.stdout.buffer
+  with Profiling.timer('filter.read'):
+    data, image = readImage(stdin)
+  crop_box = getCropBox(image.size, box, ratio)
+  stdout.write(encodeCrop(data, image, crop_box, output_format, quality))
+  stdout.flush()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+
+from fractions import Fraction
+
+BORDER_SIZE_POINTER = 8
+
+RESIZE_CORRECTION = 4
+
+RESIZE_NONE = 0
+RESIZE_RIGHT = 1
+RESIZE_LEFT = 2
+RESIZE_TOP = 4
+RESIZE_BOTTOM = 8
+
+RESIZE_TOP_RIGHT = RESIZE_TOP + RESIZE_RIGHT
+RESIZE_TOP_LEFT = RESIZE_TOP + RESIZE_LEFT
+RESIZE_BOTTOM_RIGHT = RESIZE_BOTTOM + RESIZE_RIGHT
+RESIZE_BOTTOM_LEFT = RESIZE_BOTTOM + RESIZE_LEFT
+
+MIN_WIDTH = 20
+
+# ISO 216 paper, 210 x 297 mm: exact, unlike 1:sqrt(2)
+A4_RATIO = (210, 297)
+
+def getScaleFactor(width, height, max_width, max_height):
+  # shrink to fit the area, never enlarge
+  factor_w = max_width / width
+  factor_h = max_height / height
+  return min(factor_w, factor_h, 1.0)
+
+def getRatioTerms(ratio_width, ratio_height):
+  # the ratio as coprime integers (16:9, 3:2 for 1.5:1, 70:99 for
+  # 210:297), so that sides computed from it are exact
+  ratio = Fraction(ratio_width) / Fraction(ratio_height)
+  return ratio.numerator, ratio.denominator
+
+## CROP BOX
+# Selection geometry without any GTK dependency: the Selector widget
+# builds on it and so does the headless batch mode.
+class CropBox():
+
+  __slots__ = ('x', 'y', 'width', 'height', 'min_size', 'max_width', 'max_height',
+               'ratio_width', 'ratio_height', 'fix_ratio')
+
+  def __init__(self, max_width=10, max_height=10):
+    self.x = 0
+    self.y = 0
+    self.width = MIN_WIDTH
+    self.height = MIN_WIDTH
+    self.min_size = MIN_WIDTH
+    self.max_width = max_width
+    self.max_height = max_height
+    self.ratio_width = 16
+    self.ratio_height = 9
+    self.fix_ratio = True
+
+  # GET
+  def getPosition(self):
+    return self.x, self.y
+
+  def getSize(self):
+    return self.width, self.height
+
+  def getBox(self):
+    return self.x, self.y, self.width, self.height
+
+  def getRatio(self):
+    return self.ratio_width, self.ratio_height
+
+  def getFixRatio(self):
+    return self.fix_ratio
+
+  def getValidWidth(self, width):
+    if width <= 0:
+      width = 1
+    elif self.x + width > self.max_width:
+      width = self.max_width - self.x
+    return width
+
+  def getValidHeight(self, height):
+    if height <= 0:
+      height = 1
+    elif self.y + height > self.max_height:
+      height = self.max_height - self.y
+    return height
+
+  def getValidPosition(self, x, y):
+    if x < 0:
+      x = 0
+    elif x + self.width > self.max_width:
+      x = self.max_width - self.width
+    if y < 0:
+      y = 0
+    elif y + self.height > self.max_height:
+      y = self.max_height - self.height
+    return x, y
+
+  def getResizeType(self, x, y):
+    width, height = self.width, self.height
+    frame_x, frame_y = self.x, self.y
+    # check if inside/left/right/top/bottom
+    inside = x >= frame_x and x <= frame_x + width and \
+             y >= frame_y and y <= frame_y + height
+    left = x >= frame_x and x <= frame_x + BORDER_SIZE_POINTER
+    right = x >= frame_x + width - BORDER_SIZE_POINTER and x <= frame_x + width
+    top = y >= frame_y and y <= frame_y + BORDER_SIZE_POINTER
+    bottom = y >= frame_y + height - BORDER_SIZE_POINTER and y <= frame_y + height
+    # confront results
+    if not inside:
+      resize = RESIZE_NONE
+    else:
+      if top and left:
+        resize = RESIZE_TOP_LEFT
+      elif top and right:
+        resize = RESIZE_TOP_RIGHT
+      elif bottom and left:
+        resize = RESIZE_BOTTOM_LEFT
+      elif bottom and right:
+        resize = RESIZE_BOTTOM_RIGHT
+      elif left:
+        resize = RESIZE_LEFT
+      elif right:
+        resize = RESIZE_RIGHT
+      elif top:
+        resize = RESIZE_TOP
+      elif bottom:
+        resize = RESIZE_BOTTOM
+      else:
+        resize = RESIZE_NONE
+    return resize
+
+  # CHECK
+  def checkRatio(self):
+    # the height follows the width; the width follows the height only when
+    # the first didn't fit, as going back and forth would floor the box a
+    # pixel smaller on each check
+    self.setWidth(self.width)
+    if self.fix_ratio and self.height != self.width * self.ratio_height // self.ratio_width:
+      self.setHeight(self.height)
+
+  def isValidPosition(self, x, y):
+    return x >= 0 and x + self.width <= self.max_width and \
+           y >= 0 and y + self.height <= self.max_height
+
+  def isPositionInternal(self, x, y):
+    return x >= self.x and x <= self.x + self.width and \
+           y >= self.y and y <= self.y + self.height
+
+
+  # SET
+  def setSizeMin(self, size):
+    self.min_size = size
+
+  def setSizeMax(self, width, height):
+    self.max_width = width
+    self.max_height = height
+
+  def setRatio(self, ratio_width, ratio_height):
+    self.ratio_width, self.ratio_height = getRatioTerms(ratio_width, ratio_height)
+
+  def fixRatio(self, fix=True):
+    self.fix_ratio = fix
+
+  def set(self, x, y, width, height):
+    self.moveTo(x, y)
+    self.setSize(width, height)
+
+  def setWidth(self, width):
+    width = int(self.getValidWidth(width))
+    if self.fix_ratio:
+      height = int(width * self.ratio_height // self.ratio_width)
+    else:
+      height = self.height
+    if width >= self.min_size and height >= self.min_size and \
+       self.x + width <= self.max_width and self.y + height <= self.max_height:
+      self.setSize(width, height)
+
+  def setHeight(self, height):
+    height = int(self.getValidHeight(height))
+    if self.fix_ratio:
+      width = int(height * self.ratio_width // self.ratio_height)
+    else:
+      width = self.width
+    if width >= self.min_size and height >= self.min_size and \
+       self.x + width <= self.max_width and self.y + height <= self.max_height:
+      self.setSize(width, height)
+
+  def setSize(self, width, height):
+    self.width = width
+    self.height = height
+
+  # MOVE
+  def move(self, x, y):
+    x, y = self.getValidPosition(x, y)
+    self.moveTo(x, y)
+
+  def moveTo(self, x, y):
+    self.x = x
+    self.y = y
+
+  # RESIZE
+  def resizeBottom(self, x, y):
+    y = y + RESIZE_CORRECTION
+    y_s = self.y
+    y_e = min(max(y, y_s + self.min_size), self.max_height)
+    height = y_e - y_s
+    width = int(height * self.ratio_width // self.ratio_height)
+    # fit width in image
+    x_s, width = self.fitWidth(width)
+    if self.fix_ratio:
+      height = int(width * self.ratio_height // self.ratio_width)
+    # set
+    start_x = x_s
+    start_y = y_s
+    self.set(start_x, start_y, width, height)
+
+  def resizeTop(self, x, y):
+    y = y - RESIZE_CORRECTION
+    y_e = self.y + self.height
+    y_s = min(max(y, 0), y_e - self.min_size)
+    height = y_e - y_s
+    width = int(height * self.ratio_width // self.ratio_height)
+    # fit width in image
+    x_s, width = self.fitWidth(width)
+    if self.fix_ratio:
+      height = int(width * self.ratio_height // self.ratio_width)
+    y_s = y_e - height
+    # set
+    start_x = x_s
+    start_y = y_s
+    self.set(start_x, start_y, width, height)
+
+  def resizeRight(self, x, y):
+    x = x + RESIZE_CORRECTION
+    x_s = self.x
+    x_e = min(max(x, x_s + self.min_size), self.max_width)
+    width = x_e - x_s
+    height = int(width * self.ratio_height // self.ratio_width)
+    # fit width in image
+    y_s, height = self.fitHeight(height)
+    if self.fix_ratio:
+      width = int(height * self.ratio_width // self.ratio_height)
+    # set
+    start_x = x_s
+    start_y = y_s
+    self.set(start_x, start_y, width, height)
+
+  def resizeLeft(self, x, y):
+    x = x - RESIZE_CORRECTION
+    x_e = self.x + self.width
+    x_s = min(max(x, 0), x_e - self.min_size)
+    width = x_e - x_s
+    height = int(width * self.ratio_height // self.ratio_width)
+    # fit width in image
+    y_s, height = self.fitHeight(height)
+    if self.fix_ratio:
+      width = int(height * self.ratio_width // self.ratio_height)
+    x_s = x_e - width
+    # set
+    start_x = x_s
+    start_y = y_s
+    self.set(start_x, start_y, width, height)
+
+  def resizeTopLeft(self, x, y):
+    x_e = self.x + self.width
+    y_e = self.y + self.height
+    x_s = min(max(x, 0), x_e - self.min_size)
+    y_s = min(max(y, 0), y_e - self.min_size)
+    # Fit selection
+    area_width = x_e - x_s
+    area_height = y_e - y_s
+    width, height = self.fitToArea(area_width, area_height)
+    # Set starting point
+    start_x = x_e - width
+    start_y = y_e - height
+    self.set(start_x, start_y, width, height)
+
+  def resizeTopRight(self, x, y):
+    x_s = self.x
+    y_e = self.y + self.height
+    x_e = min(max(x, x_s + self.min_size), self.max_width)
+    y_s = min(max(y, 0), y_e - self.min_size)
+    # Fit selection
+    area_width = x_e - x_s
+    area_height = y_e - y_s
+    width, height = self.fitToArea(area_width, area_height)
+    # Set starting point
+    start_x = x_s
+    start_y = y_e - height
+    self.set(start_x, start_y, width, height)
+
+  def resizeBottomLeft(self, x, y):
+    x_e = self.x + self.width
+    y_s = self.y
+    x_s = min(max(x, 0), x_e - self.min_size)
+    y_e = min(max(y, y_s + self.min_size), self.max_height)
+    # Fit selection
+    area_width = x_e - x_s
+    area_height = y_e - y_s
+    width, height = self.fitToArea(area_width, area_height)
+    # Set starting point
+    start_x = x_e - width
+    start_y = y_s
+    self.set(start_x, start_y, width, height)
+
+  def resizeBottomRight(self, x, y):
+    x_s = self.x
+    y_s = self.y
+    x_e = min(max(x, x_s + self.min_size), self.max_width)
+    y_e = min(max(y, y_s + self.min_size), self.max_height)
+    # Fit selection
+    area_width = x_e - x_s
+    area_height = y_e - y_s
+    width, height = self.fitToArea(area_width, area_height)
+    # Set starting point
+    start_x = x_s
+    start_y = y_s
+    self.set(start_x, start_y, width, height)
+
+  # FITTING
+  def fitToArea(self, area_width, area_height):
+    if self.fix_ratio:
+      # area_height / ratio_height < area_width / ratio_width, without
+      # dividing
+      if area_height * self.ratio_width < area_width * self.ratio_height:
+        # fit height
+        height = area_height
+        width = int(height * self.ratio_width // self.ratio_height)
+      else:
+        # fit width
+        width = area_width
+        height = int(width * self.ratio_height // self.ratio_width)
+    else:
+      height = area_height
+      width = area_width
+    return width, height
+
+  def fitWidth(self, width):
+    if not self.fix_ratio:
+      return self.x, self.width
+    if width > self.max_width:
+      width = self.max_width
+      x_s = 0
+      x_e = self.max_width
+      return x_s, width
+    lim = int((width - self.width)/2)
+    x_s = self.x - lim
+    x_e = x_s + width
+    if x_s < 0:
+      x_s = 0
+      x_e = width
+    elif x_e > self.max_width:
+      x_e = self.max_width
+      x_s = self.max_width - width
+    return x_s, width
+
+  def fitHeight(self, height):
+    if not self.fix_ratio:
+      return self.y, self.height
+    if height > self.max_height:
+      height = self.max_height
+      y_s = 0
+      y_e = self.max_height
+      return y_s, height
+    lim = int((height - self.height)/2)
+    y_s = self.y - lim
+    y_e = self.y + self.height + lim
+    if y_s < 0:
+      y_s = 0
+      y_e = height
+    elif y_e > self.max_height:
+      y_e = self.max_height
+      y_s = self.max_height - height
+    return y_s, height
+
+  # HEADLESS
+  def fitCentered(self):
+    # largest box with the current ratio, centered in the area
+    width, height = self.fitToArea(self.max_width, self.max_height)
+    x = int((self.max_width - width) / 2)
+    y = int((self.max_height - height) / 2)
+    self.set(x, y, width, height)
+
+  def clampTo(self, x, y, width, height):
+    # fit an arbitrary box inside the area
+    self.setSize(min(max(width, 1), self.max_width), min(max(height, 1), self.max_height))
+    self.move(x, y)
+
+## BATCH
+def fitBoxes(normalized_box, sizes, ratio=None):
+  # the same box, in coordinates relative to the image size, for many
+  # images at once: fit the ratio inside the box (as CropBox.fitToArea)
+  # and clamp it to each image (as CropBox.clampTo); returns (left, top,
+  # right, bottom) boxes
+  # (NumPy is imported here so that the GUI and plain crops start without it)
+  import numpy
+  sizes = numpy.asarray(sizes, dtype=numpy.float64).reshape(-1, 2)
+  image_width, image_height = sizes[:, 0], sizes[:, 1]
+  norm_x, norm_y, norm_width, norm_height = normalized_box
+  x = norm_x * image_width
+  y = norm_y * image_height
+  width = norm_width * image_width
+  height = norm_height * image_height
+  if ratio is not None:
+    ratio_width, ratio_height = getRatioTerms(*ratio)
+    fit_height = height * ratio_width < width * ratio_height
+    width, height = numpy.where(fit_height, numpy.floor_divide(height * ratio_width, ratio_height), width), \
+                    numpy.where(fit_height, height, numpy.floor_divide(width * ratio_height, ratio_width))
+  width = numpy.clip(numpy.floor(width), 1, image_width)
+  height = numpy.clip(numpy.floor(height), 1, image_height)
+  x = numpy.floor(numpy.clip(x, 0, image_width - width))
+  y = numpy.floor(numpy.clip(y, 0, image_height - height))
+  boxes = numpy.stack((x, y, x + width, y + height), axis=1).astype(numpy.int64)
+  return [tuple(box) for box in boxes.tolist()]
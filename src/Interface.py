@@ -3,39 +3,57 @@
 import os
 import configparser
 import math
+import threading
 
+import cairo
 import gi
 gi.require_version('Gtk', '3.0')
 
 from gi.repository import GObject
+from gi.repository import GLib
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GdkPixbuf
-from PIL import Image
+
+from src import Batch
+from src import Crop
+from src import Profiling
+from src import Session
+from src import Saver
+from src.Geometry import CropBox, getScaleFactor, A4_RATIO
+from src.Geometry import RESIZE_NONE, RESIZE_RIGHT, RESIZE_LEFT, RESIZE_TOP, RESIZE_BOTTOM
+from src.Geometry import RESIZE_TOP_RIGHT, RESIZE_TOP_LEFT, RESIZE_BOTTOM_RIGHT, RESIZE_BOTTOM_LEFT
 
 path = os.path.abspath(__file__)
 MAIN_FOLDER = os.path.dirname(path)
 
 BORDER_SIZE = 4
-BORDER_SIZE_POINTER = 8
-
-RESIZE_CORRECTION = 4
+# font size of the selector names
+LABEL_SIZE = 12
+# distance of a new selector from the active one
+NEW_SELECTOR_OFFSET = 20
 
 WIN_WIDTH = 800
 WIN_HEIGHT = 600
 
-RESIZE_NONE = 0
-RESIZE_RIGHT = 1
-RESIZE_LEFT = 2
-RESIZE_TOP = 4
-RESIZE_BOTTOM = 8
-
-RESIZE_TOP_RIGHT = RESIZE_TOP + RESIZE_RIGHT
-RESIZE_TOP_LEFT = RESIZE_TOP + RESIZE_LEFT
-RESIZE_BOTTOM_RIGHT = RESIZE_BOTTOM + RESIZE_RIGHT
-RESIZE_BOTTOM_LEFT = RESIZE_BOTTOM + RESIZE_LEFT
-
-MIN_WIDTH = 20
+CURSOR_TYPES = (Gdk.CursorType.LEFT_PTR,
+                Gdk.CursorType.FLEUR,
+                Gdk.CursorType.TOP_SIDE,
+                Gdk.CursorType.BOTTOM_SIDE,
+                Gdk.CursorType.RIGHT_SIDE,
+                Gdk.CursorType.LEFT_SIDE,
+                Gdk.CursorType.TOP_LEFT_CORNER,
+                Gdk.CursorType.TOP_RIGHT_CORNER,
+                Gdk.CursorType.BOTTOM_LEFT_CORNER,
+                Gdk.CursorType.BOTTOM_RIGHT_CORNER)
+
+# zoom factor for each scroll/key step, largest zoom and pan step
+ZOOM_STEP = 1.25
+MAX_ZOOM = 4.0
+PAN_STEP = 40
+
+# painted where a tile is still being decoded
+TILE_PLACEHOLDER_COLOUR = (0.5, 0.5, 0.5)
 
 SELECTOR_COLOUR = (0.533, 0.03, 0.576)
 
@@ -45,383 +63,152 @@ CONFIG_DEFAULT = {'RatioWidth' : '16',
                   'FixRatio' : 'True',
                   'SelectorR' : '0.533',
                   'SelectorG' : '0.03',
-                  'SelectorB' : '0.576'
+                  'SelectorB' : '0.576',
+                  'OutputFormat' : 'png',
+                  'Quality' : '90',
+                  'AutoTrim' : 'False',
+                  'OutputSizes' : ''
                  }
 
+def imageToPixbuf(image):
+  # image must be RGB or RGBA
+  has_alpha = image.mode == 'RGBA'
+  width, height = image.size
+  data = GLib.Bytes.new(image.tobytes())
+  rowstride = width * len(image.mode)
+  return GdkPixbuf.Pixbuf.new_from_bytes(data, GdkPixbuf.Colorspace.RGB, has_alpha, 8, width, height, rowstride)
+
+def getScrollDeltas(event):
+  ok, delta_x, delta_y = event.get_scroll_deltas()
+  if ok:
+    return delta_x, delta_y
+  if event.direction == Gdk.ScrollDirection.UP:
+    return 0, -1
+  elif event.direction == Gdk.ScrollDirection.DOWN:
+    return 0, 1
+  elif event.direction == Gdk.ScrollDirection.LEFT:
+    return -1, 0
+  elif event.direction == Gdk.ScrollDirection.RIGHT:
+    return 1, 0
+  return 0, 0
+
 ## SELECTOR
-class Selector():
+# The selection is kept in image coordinates (image_box); the CropBox
+# coordinates are the same box on the whole image at the current zoom,
+# where the pointer moves and resizes it.
+class Selector(CropBox):
+
+  __slots__ = ('interface', 'colour', 'canvas', 'name', 'active', 'image_box')
 
-  def __init__(self, interface):
+  def __init__(self, interface, name='1'):
+    CropBox.__init__(self)
     self.interface = interface
-    # selector data
-    self.x = 0
-    self.y = 0
-    self.width = MIN_WIDTH
-    self.height = MIN_WIDTH
-    self.min_size = MIN_WIDTH
-    self.max_width = 10
-    self.max_height = 10
-    self.ratio_width = 16
-    self.ratio_height = 9
-    self.fix_ratio = True
     self.colour = SELECTOR_COLOUR
-    # selector
-    self.selector = self.interface.builder.get_object('Selector')
+    # the name ends up in the output names when there are several
+    self.name = name
+    self.active = True
+    # the selector is painted by the image canvas
+    self.canvas = self.interface.builder.get_object('Canvas')
+    self.storeBox()
     self.setWidth(self.width)
-    self.selector.connect('draw', self.draw)
 
-  def draw(self, widget, cr):
+  @Profiling.timed('selector.draw')
+  def draw(self, cr):
     r, g, b = self.colour
     r_i = min(r + 0.2, 1)
     g_i = min(g + 0.2, 1)
     b_i = min(b + 0.2, 1)
-    # border
-    cr.set_source_rgba(r, g, b, 1)
-    # border - top
-    cr.rectangle(0, 0, self.width, BORDER_SIZE)
-    cr.fill()
-    # border - right
-    cr.rectangle(self.width-BORDER_SIZE, 0, BORDER_SIZE, self.height)
-    cr.fill()
-    # border - bottom
-    cr.rectangle(0, self.height-BORDER_SIZE, self.width, BORDER_SIZE)
-    cr.fill()
-    # border - left
-    cr.rectangle(0, 0, BORDER_SIZE, self.height)
+    # the selectors that are not being edited are fainter
+    alpha = 1 if self.active else 0.5
+    cr.save()
+    cr.translate(self.x, self.y)
+    # border: outer and inner rectangle filled with the even-odd rule
+    cr.set_source_rgba(r, g, b, alpha)
+    cr.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
+    cr.rectangle(0, 0, self.width, self.height)
+    cr.rectangle(BORDER_SIZE, BORDER_SIZE, self.width-2*BORDER_SIZE, self.height-2*BORDER_SIZE)
     cr.fill()
     # inside
-    cr.set_source_rgba(r_i, g_i, b_i, 0.3)
+    cr.set_source_rgba(r_i, g_i, b_i, 0.3 * alpha)
     cr.rectangle(BORDER_SIZE, BORDER_SIZE, self.width-2*BORDER_SIZE, self.height-2*BORDER_SIZE)
     cr.fill()
+    if len(self.interface.selectors) > 1:
+      # name in the top left corner
+      cr.set_source_rgba(r, g, b, alpha)
+      cr.set_font_size(LABEL_SIZE)
+      cr.move_to(2 * BORDER_SIZE, 2 * BORDER_SIZE + LABEL_SIZE)
+      cr.show_text(self.name)
+    cr.restore()
     return False
 
-  # GET
-  def getPosition(self):
-    return self.x, self.y
-
-  def getSize(self):
-    return self.width, self.height
+  def queueDraw(self):
+    # repaint only the area covered by the selector
+    offset_x, offset_y = self.interface.getViewOffset()
+    x = int(math.floor(self.x - offset_x))
+    y = int(math.floor(self.y - offset_y))
+    width = int(math.ceil(self.x - offset_x + self.width)) - x
+    height = int(math.ceil(self.y - offset_y + self.height)) - y
+    self.canvas.queue_draw_area(x, y, width, height)
 
+  # GET
   def getColour(self):
     return self.colour
 
-  def getRatio(self):
-    return self.ratio_width, self.ratio_height
-
-  def getFixRatio(self):
-    return self.fix_ratio
-
-  def getValidWidth(self, width):
-    if width <= 0:
-      width = 1
-    elif self.x + width > self.max_width:
-      width = self.max_width - self.x
-    return width
-
-  def getValidHeight(self, height):
-    if height <= 0:
-      height = 1
-    elif self.y + height > self.max_height:
-      height = self.max_height - self.y
-    return height
-
-  def getValidPosition(self, x, y):
-    if x < 0:
-      x = 0
-    elif x + self.width > self.max_width:
-      x = self.max_width - self.width
-    if y < 0:
-      y = 0
-    elif y + self.height > self.max_height:
-      y = self.max_height - self.height
-    return x, y
-
-  def getResizeType(self, x, y):
-    width, height = self.width, self.height
-    frame_x, frame_y = self.x, self.y
-    # check if inside/left/right/top/bottom
-    inside = x >= frame_x and x <= frame_x + width and \
-             y >= frame_y and y <= frame_y + height
-    left = x >= frame_x and x <= frame_x + BORDER_SIZE_POINTER
-    right = x >= frame_x + width - BORDER_SIZE_POINTER and x <= frame_x + width
-    top = y >= frame_y and y <= frame_y + BORDER_SIZE_POINTER
-    bottom = y >= frame_y + height - BORDER_SIZE_POINTER and y <= frame_y + height
-    # confront results
-    if not inside:
-      resize = RESIZE_NONE
-    else:
-      if top and left:
-        resize = RESIZE_TOP_LEFT
-      elif top and right:
-        resize = RESIZE_TOP_RIGHT
-      elif bottom and left:
-        resize = RESIZE_BOTTOM_LEFT
-      elif bottom and right:
-        resize = RESIZE_BOTTOM_RIGHT
-      elif left:
-        resize = RESIZE_LEFT
-      elif right:
-        resize = RESIZE_RIGHT
-      elif top:
-        resize = RESIZE_TOP
-      elif bottom:
-        resize = RESIZE_BOTTOM
-      else:
-        resize = RESIZE_NONE
-    return resize
-
-  # CHECK
-  def checkRatio(self):
-    # TODO: better
-    self.setWidth(self.width)
-    self.setHeight(self.height)
-
-  def isValidPosition(self, x, y):
-    return x >= 0 and x + self.width <= self.max_width and \
-           y >= 0 and y + self.height <= self.max_height
-
-  def isPositionInternal(self, x, y):
-    return x >= self.x and x <= self.x + self.width and \
-           y >= self.y and y <= self.y + self.height
+  def getName(self):
+    return self.name
 
+  def getImageBox(self):
+    return self.image_box
 
   # SET
-  def setSizeMin(self, size):
-    self.min_size = size
-
-  def setSizeMax(self, width, height):
-    self.max_width = width
-    self.max_height = height
-
-  def setRatio(self, ratio_width, ratio_height):
-    self.ratio_width = ratio_width
-    self.ratio_height = ratio_height
-
-  def fixRatio(self, fix=True):
-    self.fix_ratio = fix
-
   def setColour(self, colour):
     self.colour = colour
+    self.queueDraw()
 
-  def set(self, x, y, width, height):
-    self.moveTo(x, y)
-    self.setSize(width, height)
+  def setName(self, name):
+    self.name = name
+    self.queueDraw()
 
-  def setWidth(self, width):
-    width = self.getValidWidth(width)
-    if self.fix_ratio:
-      height = width * self.ratio_height / self.ratio_width
-    else:
-      height = self.height
-    if width >= self.min_size and height >= self.min_size and \
-       self.x + width <= self.max_width and self.y + height <= self.max_height:
-      self.setSize(width, height)
-
-  def setHeight(self, height):
-    height = self.getValidHeight(height)
-    if self.fix_ratio:
-      width = height * self.ratio_width / self.ratio_height
-    else:
-      width = self.width
-    if width >= self.min_size and height >= self.min_size and \
-       self.x + width <= self.max_width and self.y + height <= self.max_height:
-      self.setSize(width, height)
+  def setActive(self, active):
+    self.active = active
+    self.queueDraw()
 
   def setSize(self, width, height):
-    self.width = width
-    self.height = height
-    self.selector.set_size_request(self.width, self.height)
+    if width == self.width and height == self.height:
+      return
+    self.queueDraw()
+    CropBox.setSize(self, width, height)
+    self.storeBox()
+    self.queueDraw()
 
   # MOVE
-  def move(self, x, y):
-    x, y = self.getValidPosition(x, y)
-    self.moveTo(x, y)
-
   def moveTo(self, x, y):
-    self.x = x
-    self.y = y
-    self.interface.overlay.move(self.selector, x, y)
-
-  # RESIZE
-  def resizeBottom(self, x, y):
-    y = y + RESIZE_CORRECTION
-    y_s = self.y
-    y_e = min(max(y, y_s + self.min_size), self.max_height)
-    height = y_e - y_s
-    width = int(height * self.ratio_width / self.ratio_height)
-    # fit width in image
-    x_s, width = self.fitWidth(width)
-    if self.fix_ratio:
-      height = int(width * self.ratio_height / self.ratio_width)
-    # set
-    start_x = x_s
-    start_y = y_s
-    self.set(start_x, start_y, width, height)
-
-  def resizeTop(self, x, y):
-    y = y - RESIZE_CORRECTION
-    y_e = self.y + self.height
-    y_s = min(max(y, 0), y_e - self.min_size)
-    height = y_e - y_s
-    width = int(height * self.ratio_width / self.ratio_height)
-    # fit width in image
-    x_s, width = self.fitWidth(width)
-    if self.fix_ratio:
-      height = int(width * self.ratio_height / self.ratio_width)
-    y_s = y_e - height
-    # set
-    start_x = x_s
-    start_y = y_s
-    self.set(start_x, start_y, width, height)
-
-  def resizeRight(self, x, y):
-    x = x + RESIZE_CORRECTION
-    x_s = self.x
-    x_e = min(max(x, x_s + self.min_size), self.max_width)
-    width = x_e - x_s
-    height = int(width * self.ratio_height / self.ratio_width)
-    # fit width in image
-    y_s, height = self.fitHeight(height)
-    if self.fix_ratio:
-      width = int(height * self.ratio_width / self.ratio_height)
-    # set
-    start_x = x_s
-    start_y = y_s
-    self.set(start_x, start_y, width, height)
-
-  def resizeLeft(self, x, y):
-    x = x - RESIZE_CORRECTION
-    x_e = self.x + self.width
-    x_s = min(max(x, 0), x_e - self.min_size)
-    width = x_e - x_s
-    height = int(width * self.ratio_height / self.ratio_width)
-    # fit width in image
-    y_s, height = self.fitHeight(height)
-    if self.fix_ratio:
-      width = int(height * self.ratio_width / self.ratio_height)
-    x_s = x_e - width
-    # set
-    start_x = x_s
-    start_y = y_s
-    self.set(start_x, start_y, width, height)
-
-  def resizeTopLeft(self, x, y):
-    x_e = self.x + self.width
-    y_e = self.y + self.height
-    x_s = min(max(x, 0), x_e - self.min_size)
-    y_s = min(max(y, 0), y_e - self.min_size)
-    # Fit selection
-    area_width = x_e - x_s
-    area_height = y_e - y_s
-    width, height = self.fitToArea(area_width, area_height)
-    # Set starting point
-    start_x = x_e - width
-    start_y = y_e - height
-    self.set(start_x, start_y, width, height)
-
-  def resizeTopRight(self, x, y):
-    x_s = self.x
-    y_e = self.y + self.height
-    x_e = min(max(x, x_s + self.min_size), self.max_width)
-    y_s = min(max(y, 0), y_e - self.min_size)
-    # Fit selection
-    area_width = x_e - x_s
-    area_height = y_e - y_s
-    width, height = self.fitToArea(area_width, area_height)
-    # Set starting point
-    start_x = x_s
-    start_y = y_e - height
-    self.set(start_x, start_y, width, height)
-
-  def resizeBottomLeft(self, x, y):
-    x_e = self.x + self.width
-    y_s = self.y
-    x_s = min(max(x, 0), x_e - self.min_size)
-    y_e = min(max(y, y_s + self.min_size), self.max_height)
-    # Fit selection
-    area_width = x_e - x_s
-    area_height = y_e - y_s
-    width, height = self.fitToArea(area_width, area_height)
-    # Set starting point
-    start_x = x_e - width
-    start_y = y_s
-    self.set(start_x, start_y, width, height)
-
-  def resizeBottomRight(self, x, y):
-    x_s = self.x
-    y_s = self.y
-    x_e = min(max(x, x_s + self.min_size), self.max_width)
-    y_e = min(max(y, y_s + self.min_size), self.max_height)
-    # Fit selection
-    area_width = x_e - x_s
-    area_height = y_e - y_s
-    width, height = self.fitToArea(area_width, area_height)
-    # Set starting point
-    start_x = x_s
-    start_y = y_s
-    self.set(start_x, start_y, width, height)
-
-  # FITTING
-  def fitToArea(self, area_width, area_height):
-    if self.fix_ratio:
-      factor_w = area_width / self.ratio_width
-      factor_h = area_height / self.ratio_height
-      if factor_h < factor_w:
-        # fit height
-        height = area_height
-        width = int(height * self.ratio_width / self.ratio_height)
-      else:
-        # fit width
-        width = area_width
-        height = int(width * self.ratio_height / self.ratio_width)
-    else:
-      height = area_height
-      width = area_width
-    return width, height
-
-  def fitWidth(self, width):
-    if not self.fix_ratio:
-      return self.x, self.width
-    if width > self.max_width:
-      width = self.max_width
-      x_s = 0
-      x_e = self.max_width
-      return x_s, width
-    lim = int((width - self.width)/2)
-    x_s = self.x - lim
-    x_e = x_s + width
-    if x_s < 0:
-      x_s = 0
-      x_e = width
-    elif x_e > self.max_width:
-      x_e = self.max_width
-      x_s = self.max_width - width
-    return x_s, width
-
-  def fitHeight(self, height):
-    if not self.fix_ratio:
-      return self.y, self.height
-    if height > self.max_height:
-      height = self.max_height
-      y_s = 0
-      y_e = self.max_height
-      return y_s, height
-    lim = int((height - self.height)/2)
-    y_s = self.y - lim
-    y_e = self.y + self.height + lim
-    if y_s < 0:
-      y_s = 0
-      y_e = height
-    elif y_e > self.max_height:
-      y_e = self.max_height
-      y_s = self.max_height - height
-    return y_s, height
+    if x == self.x and y == self.y:
+      return
+    self.queueDraw()
+    CropBox.moveTo(self, x, y)
+    self.storeBox()
+    self.queueDraw()
+
+  # ZOOM
+  def storeBox(self):
+    zoom = self.interface.zoom
+    self.image_box = self.x / zoom, self.y / zoom, self.width / zoom, self.height / zoom
+
+  def project(self, zoom):
+    # show the image box at zoom, without rounding it: zooming in and
+    # out leaves the selection as it was
+    x, y, width, height = self.image_box
+    CropBox.moveTo(self, x * zoom, y * zoom)
+    CropBox.setSize(self, width * zoom, height * zoom)
 
 ## INTERFACE
 class Interface():
 
-  def __init__(self, imagepath):
-    self.imagepath = imagepath
+  def __init__(self, addresses):
+    # addresses: images and folders of images
+    self.session = Session.Session(addresses, (WIN_WIDTH, WIN_HEIGHT), imageToPixbuf)
+    self.imagepath = self.session.getPath()
     self.builder = Gtk.Builder.new()
     ui_file = os.path.join(MAIN_FOLDER, 'ui/Main.glade')
     self.builder.add_from_file(ui_file)
@@ -429,6 +216,8 @@ class Interface():
     self.main_window = self.builder.get_object('MainWindow')
     self.main_window.connect('destroy', self.close)
     self.overlay = self.builder.get_object('Overlay')
+    canvas = self.builder.get_object('Canvas')
+    canvas.connect('draw', self.drawCanvas)
     if self.loadImage():
       self.load_error = False
       self.setupAll()
@@ -436,8 +225,7 @@ class Interface():
       self.load_error = True
 
   def setupAll(self):
-    image_name = os.path.basename(self.imagepath)
-    self.main_window.set_title(image_name)
+    self.updateTitle()
     # load settings
     self.loadSettings()
     # load events and accels
@@ -447,12 +235,20 @@ class Interface():
     self.drag = False
     self.resize = RESIZE_NONE
     self.resize_start = False
+    self.cursors_display = None
+    self.cursor_type = None
+    self.pointer_position = 0, 0
+    self.pointer_tick = None
     # load Selector
     self.loadSelector()
+    # save queue
+    self.saver = Saver.SaveQueue(self.onSaveCompleted)
     # setup
     self.setupRatioSelector()
     self.setupFixRatio()
     self.setupSaveButton()
+    self.setupApplyButton()
+    self.setupFormatSelector()
     self.setupColourChooser()
 
 
@@ -465,13 +261,29 @@ class Interface():
       self.main_window.set_title('Error loading image')
       self.main_window.set_size_request(20, 20)
     else:
-      overlay = self.builder.get_object('Overlay')
-      allocation = overlay.get_allocation()
-      max_width, max_height = allocation.width, allocation.height
-      self.selector.setSizeMax(max_width, max_height)
-      # set selector to 1/2 image width
-      self.selector.setWidth(max_width / 2)
-      self.selector.setHeight(max_height / 2)
+      self.resetSelector()
+
+  def resetSelector(self):
+    # back to a single selector
+    if len(self.selectors) > 1:
+      self.selectors = [self.selector]
+      self.selector_count = 1
+      self.selector.setName('1')
+      self.builder.get_object('Canvas').queue_draw()
+    max_width, max_height = self.getZoomedSize()
+    self.selector.setSizeMax(max_width, max_height)
+    self.selector.set(0, 0, self.selector.min_size, self.selector.min_size)
+    # set selector to 1/2 image width
+    self.selector.setWidth(max_width / 2)
+    self.selector.setHeight(max_height / 2)
+    if self.getConfigAutoTrim():
+      self.trimSelection()
+
+  def updateTitle(self):
+    title = os.path.basename(self.imagepath)
+    if self.session.getCount() > 1:
+      title += ' (' + str(self.session.getIndex() + 1) + '/' + str(self.session.getCount()) + ')'
+    self.main_window.set_title(title)
 
   def start(self):
     self.show()
@@ -479,6 +291,9 @@ class Interface():
 
   def close(self, *args):
     self.saveSettings()
+    self.session.stop()
+    if not self.load_error:
+      self.saver.stop()
     Gtk.main_quit()
 
 
@@ -511,6 +326,7 @@ class Interface():
       self.setConfigRatio()
       self.setConfigFixRatio()
       self.setConfigSelectorColour()
+      self.setConfigOutputFormat()
       # save
       self.config.write(open(self.config_file, 'w'))
 
@@ -529,6 +345,28 @@ class Interface():
     b = float(self.getConfig('SelectorB'))
     return r, g, b
 
+  def getConfigOutputFormat(self):
+    output_format = self.getConfig('OutputFormat')
+    if not output_format in Crop.OUTPUT_FORMATS:
+      output_format = Crop.FORMAT_PNG
+    return output_format
+
+  def getConfigQuality(self):
+    return int(self.getConfig('Quality'))
+
+  def getConfigOutputSizes(self):
+    # None saves the crop only, otherwise a list of sizes as for --sizes
+    sizes = self.getConfig('OutputSizes').strip()
+    if sizes == '':
+      return None
+    try:
+      return Batch.parseSizes(sizes)
+    except ValueError:
+      return None
+
+  def getConfigAutoTrim(self):
+    return self.getConfigBool('AutoTrim')
+
   # SET CONFIG
   def setConfigRatio(self):
     ratio_width, ratio_height = self.selector.getRatio()
@@ -545,15 +383,51 @@ class Interface():
     self.setConfig('SelectorG', g)
     self.setConfig('SelectorB', b)
 
+  def setConfigOutputFormat(self):
+    self.setConfig('OutputFormat', self.output_format)
+
   ## INTERFACE SETUP
   def loadAccels(self):
     accels = Gtk.AccelGroup()
     accelerator = '<control>s'
     key, mod = Gtk.accelerator_parse(accelerator)
     accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.saveResized)
+    accelerator = '<control><shift>s'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.applyToImages)
+    accelerator = '<control>t'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.trimSelection)
+    accelerator = '<control>r'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.smartSelection)
+    accelerator = '<control>n'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.addSelector)
+    accelerator = 'Delete'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.removeSelector)
+    accelerator = 'Tab'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.nextSelector)
     accelerator = '<control>q'
     key, mod = Gtk.accelerator_parse(accelerator)
     accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.close)
+    accelerator = '<control>plus'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.zoomIn)
+    accelerator = '<control>minus'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.zoomOut)
+    accelerator = '<control>0'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.zoomFit)
+    accelerator = 'Page_Down'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.showNext)
+    accelerator = 'Page_Up'
+    key, mod = Gtk.accelerator_parse(accelerator)
+    accels.connect(key, mod, Gtk.AccelFlags.LOCKED, self.showPrevious)
     self.main_window.add_accel_group(accels)
 
   def setupRatioSelector(self):
@@ -569,18 +443,17 @@ class Interface():
     el = model[index][0]
     ratio_txt = model[index][1]
     if ratio_txt == "A4 Paper":
-      width = 1
-      height = math.sqrt(2)
+      width, height = A4_RATIO
     elif ratio_txt == "A4 Paper (horizontal)":
-      width = math.sqrt(2)
-      height = 1
+      height, width = A4_RATIO
     else:
       width, height = ratio_txt.split(':')
       width = int(width)
       height = int(height)
-    self.selector.setRatio(width, height)
-    # check selector ratio
-    self.selector.checkRatio()
+    for selector in self.selectors:
+      selector.setRatio(width, height)
+      # check selector ratio
+      selector.checkRatio()
 
   def setupFixRatio(self):
     fix_button = self.builder.get_object('FixRatio')
@@ -588,16 +461,33 @@ class Interface():
     fix_button.connect('toggled', self.onFixRatioChanged)
 
   def onFixRatioChanged(self, widget):
-    if widget.get_active():
-      self.selector.fixRatio()
-      self.selector.checkRatio()
-    else:
-      self.selector.fixRatio(False)
+    for selector in self.selectors:
+      if widget.get_active():
+        selector.fixRatio()
+        selector.checkRatio()
+      else:
+        selector.fixRatio(False)
 
   def setupSaveButton(self):
     btn = self.builder.get_object('SaveButton')
     btn.connect('clicked', self.saveResized)
 
+  def setupApplyButton(self):
+    self.applying = False
+    btn = self.builder.get_object('ApplyButton')
+    btn.connect('clicked', self.applyToImages)
+
+  def setupFormatSelector(self):
+    self.output_format = self.getConfigOutputFormat()
+    self.quality = self.getConfigQuality()
+    self.output_sizes = self.getConfigOutputSizes()
+    format_entry = self.builder.get_object('FormatEntry')
+    format_entry.set_active_id(self.output_format)
+    format_entry.connect('changed', self.onFormatChanged)
+
+  def onFormatChanged(self, widget):
+    self.output_format = widget.get_active_id()
+
   def setupColourChooser(self):
     btn = self.builder.get_object('ChooseColourButton')
     colour = self.selector.getColour()
@@ -606,7 +496,8 @@ class Interface():
 
   def changeSelectorColour(self, widget):
     r, g, b, a = widget.get_rgba()
-    self.selector.setColour((r,g,b))
+    for selector in self.selectors:
+      selector.setColour((r,g,b))
 
   ## INTERFACE - INFO LABEL
   def showInfoMessage(self, message, duration=2000):
@@ -646,29 +537,238 @@ class Interface():
 
 
   ## IMAGE OPERATIONS
+  @Profiling.timed('interface.load_image')
   def loadImage(self):
     try:
-      image = self.builder.get_object('Image')
-      pixbuf = GdkPixbuf.Pixbuf.new_from_file(self.imagepath)
-      pixbuf = self.resizeImage(pixbuf)
-      image.set_from_pixbuf(pixbuf)
+      self.loadView()
+      canvas = self.builder.get_object('Canvas')
+      canvas.set_size_request(self.view_width, self.view_height)
+      canvas.queue_draw()
       return True
     except Exception:
       return False
 
+  def loadView(self):
+    # zoomable tiled view when PIL can read the image, fixed preview otherwise
+    self.pyramid = self.session.getPyramid()
+    if self.pyramid is not None:
+      width, height = self.pyramid.getSize()
+      self.fit_zoom = getScaleFactor(width, height, WIN_WIDTH, WIN_HEIGHT)
+    else:
+      self.pixbuf = self.loadPreview()
+      width = self.pixbuf.get_width() / self.scale_factor
+      height = self.pixbuf.get_height() / self.scale_factor
+      self.fit_zoom = self.scale_factor
+    self.image_width, self.image_height = width, height
+    self.view_width = max(int(width * self.fit_zoom), 1)
+    self.view_height = max(int(height * self.fit_zoom), 1)
+    self.zoom = self.fit_zoom
+    self.view_x = 0
+    self.view_y = 0
+
+  @Profiling.timed('interface.draw')
+  def drawCanvas(self, widget, cr):
+    # image and selector are painted together, clipped to the dirty area
+    Profiling.count('interface.draw')
+    if self.load_error:
+      return False
+    if self.pyramid is None:
+      Gdk.cairo_set_source_pixbuf(cr, self.pixbuf, 0, 0)
+      cr.paint()
+    else:
+      self.drawTiles(cr)
+    # selectors are placed on the whole image at the current zoom
+    offset_x, offset_y = self.getViewOffset()
+    cr.save()
+    cr.translate(-offset_x, -offset_y)
+    for selector in self.selectors:
+      selector.draw(cr)
+    cr.restore()
+    return False
+
+  @Profiling.timed('interface.draw_tiles')
+  def drawTiles(self, cr):
+    level = self.pyramid.getLevel(self.zoom)
+    # level pixels to canvas pixels
+    scale = self.pyramid.getLevelScale(level) * self.zoom
+    # only the tiles in the dirty area
+    x_s, y_s, x_e, y_e = cr.clip_extents()
+    box = (self.view_x + x_s / self.zoom, self.view_y + y_s / self.zoom,
+           self.view_x + x_e / self.zoom, self.view_y + y_e / self.zoom)
+    columns, rows = self.pyramid.getTileRange(level, box)
+    for tile_y in rows:
+      for tile_x in columns:
+        # tiles are decoded on the loader thread, a placeholder is painted
+        # until they are ready
+        tile = self.pyramid.findTile(level, tile_x, tile_y)
+        if tile is None:
+          self.pyramid.requestTile(level, tile_x, tile_y, self.onTileLoaded)
+        left, top, right, bottom = self.pyramid.getTileBox(level, tile_x, tile_y)
+        cr.save()
+        cr.translate(left * scale - self.view_x * self.zoom, top * scale - self.view_y * self.zoom)
+        cr.scale(scale, scale)
+        cr.rectangle(0, 0, right - left, bottom - top)
+        cr.clip()
+        if tile is None:
+          cr.set_source_rgb(*TILE_PLACEHOLDER_COLOUR)
+        else:
+          Gdk.cairo_set_source_pixbuf(cr, tile, 0, 0)
+          # no seams between scaled tiles
+          cr.get_source().set_extend(cairo.EXTEND_PAD)
+        cr.paint()
+        cr.restore()
+
+  def onTileLoaded(self):
+    # called from the loader thread
+    GLib.idle_add(self.redrawCanvas)
+
+  def redrawCanvas(self):
+    self.builder.get_object('Canvas').queue_draw()
+    return False
+
+  ## VIEW
+  def getViewOffset(self):
+    # top left corner of the canvas on the image at the current zoom
+    return self.view_x * self.zoom, self.view_y * self.zoom
+
+  def getZoomedSize(self):
+    return self.image_width * self.zoom, self.image_height * self.zoom
+
+  def getSelectorCoordinates(self, x, y):
+    # window coordinates to the coordinates of the selectors
+    x, y = self.getOverlayRelativeCoordinates(x, y)
+    offset_x, offset_y = self.getViewOffset()
+    return x + offset_x, y + offset_y
+
+  def getSelectionBox(self, selector=None):
+    # selector (the active one by default) in image coordinates
+    selector = selector or self.selector
+    return selector.getImageBox()
+
+  def setSelectionBox(self, x, y, width, height, selector=None):
+    # place the selector on a box in image coordinates
+    zoom = self.zoom
+    self.placeSelector(x * zoom, y * zoom, width * zoom, height * zoom, selector)
+
+  def placeSelector(self, x, y, width, height, selector=None):
+    # fit a box in the image at the current zoom, keeping the selector ratio
+    selector = selector or self.selector
+    max_width, max_height = self.getZoomedSize()
+    width = min(width, max_width)
+    height = min(height, max_height)
+    if selector.getFixRatio():
+      width, height = selector.fitToArea(width, height)
+    x = min(max(x, 0), max_width - width)
+    y = min(max(y, 0), max_height - height)
+    selector.set(x, y, width, height)
+
+  def setView(self, view_x, view_y, zoom):
+    self.zoom = min(max(zoom, self.fit_zoom), MAX_ZOOM)
+    max_x = self.image_width - self.view_width / self.zoom
+    max_y = self.image_height - self.view_height / self.zoom
+    self.view_x = min(max(view_x, 0), max(max_x, 0))
+    self.view_y = min(max(view_y, 0), max(max_y, 0))
+    self.projectSelectors()
+    self.builder.get_object('Canvas').queue_draw()
+
+  def projectSelectors(self):
+    # the selections don't change with the view, only how they are shown
+    max_width, max_height = self.getZoomedSize()
+    for selector in self.selectors:
+      selector.setSizeMax(max_width, max_height)
+      selector.project(self.zoom)
+
+  def zoomAt(self, zoom, x, y):
+    # the image point under (x, y) stays in place
+    if self.pyramid is None:
+      return
+    image_x = self.view_x + x / self.zoom
+    image_y = self.view_y + y / self.zoom
+    zoom = min(max(zoom, self.fit_zoom), MAX_ZOOM)
+    self.setView(image_x - x / zoom, image_y - y / zoom, zoom)
+
+  def panView(self, delta_x, delta_y):
+    # the selections move with the image
+    self.setView(self.view_x + delta_x / self.zoom, self.view_y + delta_y / self.zoom, self.zoom)
+
+  def zoomIn(self, *args):
+    self.zoomAt(self.zoom * ZOOM_STEP, self.view_width / 2, self.view_height / 2)
+
+  def zoomOut(self, *args):
+    self.zoomAt(self.zoom / ZOOM_STEP, self.view_width / 2, self.view_height / 2)
+
+  def zoomFit(self, *args):
+    self.zoomAt(self.fit_zoom, 0, 0)
+
+  ## SESSION
+  def showNext(self, *args):
+    previous = self.imagepath
+    if self.session.next():
+      self.changeImage(previous)
+
+  def showPrevious(self, *args):
+    previous = self.imagepath
+    if self.session.previous():
+      self.changeImage(previous)
+
+  def changeImage(self, previous):
+    self.imagepath = self.session.getPath()
+    if self.loadImage():
+      self.updateTitle()
+      self.resetSelector()
+    else:
+      # drop the image from the session and go back to the previous one
+      self.showInfoMessage('Error loading ' + os.path.basename(self.imagepath))
+      self.session.discard(self.imagepath)
+      self.session.goTo(previous)
+      self.imagepath = previous
+      self.loadImage()
+      self.projectSelectors()
+      self.updateTitle()
+
+  def onScroll(self, widget, event):
+    x, y = self.getOverlayRelativeCoordinates(event.x, event.y)
+    delta_x, delta_y = getScrollDeltas(event)
+    if event.state & Gdk.ModifierType.CONTROL_MASK:
+      self.zoomAt(self.zoom * ZOOM_STEP ** -delta_y, x, y)
+    elif event.state & Gdk.ModifierType.SHIFT_MASK:
+      self.panView(delta_y * PAN_STEP, delta_x * PAN_STEP)
+    else:
+      self.panView(delta_x * PAN_STEP, delta_y * PAN_STEP)
+    return True
+
+  @Profiling.timed('interface.load_preview')
+  def loadPreview(self):
+    # decode directly at preview size when the loader supports it
+    # (the JPEG loader uses DCT scaling), otherwise decode and shrink
+    image_format, width, height = GdkPixbuf.Pixbuf.get_file_info(self.imagepath)
+    if image_format is not None and width > 0 and height > 0:
+      factor = getScaleFactor(width, height, WIN_WIDTH, WIN_HEIGHT)
+      new_width = max(int(width * factor), 1)
+      new_height = max(int(height * factor), 1)
+      try:
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(self.imagepath, new_width, new_height, False)
+        self.scale_factor = factor
+        return pixbuf
+      except Exception:
+        pass
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file(self.imagepath)
+    return self.resizeImage(pixbuf)
+
+  @Profiling.timed('interface.resize_image')
   def resizeImage(self, pixbuf):
     width = pixbuf.get_width()
     height = pixbuf.get_height()
-    factor_w = WIN_WIDTH / width
-    factor_h = WIN_HEIGHT / height
-    factor = min(factor_w, factor_h, 1.0)
-    self.scale_factor = factor
+    self.scale_factor = getScaleFactor(width, height, WIN_WIDTH, WIN_HEIGHT)
     new_width = width * self.scale_factor
     new_height = height * self.scale_factor
     return pixbuf.scale_simple(new_width, new_height, GdkPixbuf.InterpType.BILINEAR)
 
   def loadSelector(self):
+    self.selectors = []
+    self.selector_count = 1
     self.selector = Selector(self)
+    self.selectors.append(self.selector)
     ratio_w, ratio_h = self.getConfigRatio()
     self.selector.setRatio(ratio_w, ratio_h)
     fix = self.getConfigFixRatio()
@@ -683,6 +783,8 @@ class Interface():
     #eventbox.connect("motion-notify-event", self.onMouseMovement)
     eventbox.connect("button-press-event", self.startDrag)
     eventbox.connect("button-release-event", self.stopDrag)
+    eventbox.add_events(Gdk.EventMask.SCROLL_MASK | Gdk.EventMask.SMOOTH_SCROLL_MASK)
+    eventbox.connect("scroll-event", self.onScroll)
 
   def getOverlayRelativeCoordinates(self, x, y):
     overlay = self.builder.get_object('Overlay')
@@ -690,27 +792,58 @@ class Interface():
     return x - alloc.x, y - alloc.y
 
   def startDrag(self, widget, event):
-    x, y = self.getOverlayRelativeCoordinates(event.x, event.y)
+    self.flushPointer()
+    x, y = self.getSelectorCoordinates(event.x, event.y)
     if self.resize != RESIZE_NONE:
       self.resize_start = True
       self.resize_start_point = x, y
-    elif self.selector.isPositionInternal(x, y):
+    else:
+      # a click on another selector makes it the active one
+      selector = self.getSelectorAt(x, y)
+      if selector is None:
+        return
+      if selector != self.selector:
+        self.activateSelector(selector)
       self.drag = True
       self.drag_start_position = x, y
       self.setPointerDrag(True)
 
   def stopDrag(self, widget, event):
+    self.flushPointer()
     self.drag = False
     self.resize_start = False
     self.setPointerDrag(False)
 
+  @Profiling.timed('interface.motion')
   def onMouseMovement(self, widget, event):
+    # keep only the last pointer position: the selector is updated at
+    # most once per frame, from the frame clock
+    Profiling.count('interface.motion')
+    self.pointer_position = event.x, event.y
+    if self.pointer_tick is None:
+      self.pointer_tick = self.main_window.add_tick_callback(self.onFrameTick)
+
+  def onFrameTick(self, widget, frame_clock):
+    Profiling.count('interface.frame_tick')
+    self.pointer_tick = None
+    self.updatePointer(*self.pointer_position)
+    return GLib.SOURCE_REMOVE
+
+  def flushPointer(self):
+    # apply the pending position right away (e.g. before a click)
+    if self.pointer_tick is not None:
+      self.main_window.remove_tick_callback(self.pointer_tick)
+      self.pointer_tick = None
+      self.updatePointer(*self.pointer_position)
+
+  @Profiling.timed('interface.update_pointer')
+  def updatePointer(self, pointer_x, pointer_y):
     overlay = self.builder.get_object('Overlay')
     alloc = overlay.get_allocation()
-    if event.y <= alloc.y:
+    if pointer_y <= alloc.y:
       self.resetCursor()
     else:
-      x, y = self.getOverlayRelativeCoordinates(event.x, event.y)
+      x, y = self.getSelectorCoordinates(pointer_x, pointer_y)
       if not self.drag and not self.resize_start:
         # check resize
         resize_type = self.selector.getResizeType(x, y)
@@ -798,40 +931,221 @@ class Interface():
   def resetCursor(self):
     self.changeCursorType(Gdk.CursorType.LEFT_PTR)
 
+  def loadCursors(self, display):
+    self.cursors = {}
+    for cursor_type in CURSOR_TYPES:
+      self.cursors[cursor_type] = Gdk.Cursor.new_for_display(display, cursor_type)
+    self.cursors_display = display
+    self.cursor_type = None
+
   def changeCursorType(self, cursor_type):
+    # cursors are built once per display and only set when they change
+    display = self.main_window.get_display()
+    if display != self.cursors_display:
+      self.loadCursors(display)
+    if cursor_type == self.cursor_type:
+      return
     window = self.main_window.get_window()
-    display = Gdk.Display.get_default()
-    cursor = Gdk.Cursor.new_for_display(display, cursor_type)
-    window.set_cursor(cursor)
+    window.set_cursor(self.cursors[cursor_type])
+    self.cursor_type = cursor_type
 
+  @Profiling.timed('interface.save_request')
   def saveResized(self, *args):
-    selector_width, selector_height = self.selector.getSize()
-    width, height = selector_width / self.scale_factor, selector_height / self.scale_factor
-    selector_x, selector_y = self.selector.getPosition()
-    x, y = selector_x / self.scale_factor, selector_y / self.scale_factor
-    base_img = Image.open(self.imagepath)
-    base_img.load()
-    new_img = base_img.crop((int(x), int(y), int(x+width), int(y+height)))
-    image_folder = os.path.dirname(self.imagepath)
-    image_name = os.path.basename(self.imagepath)
-    basename, extension = os.path.splitext(image_name)
-    # NOTE: force output extension to png
-    extension = '.png'
-    savename = basename + '.resized' + extension
-    savepath = os.path.join(image_folder, savename)
-    keep = True
-    i = 1
-    while keep:
-      if os.path.exists(savepath):
-        savename = basename + '.resized-' + str(i) + extension
-        savepath = os.path.join(image_folder, savename)
-      else:
-        keep = False
-      i += 1
-    #print('Saving: ' + savepath)
-    new_img.save(savepath)
-    self.showInfoMessage('Image saved as ' + savename)
+    # with several selectors, all of them are saved from one decode
+    if len(self.selectors) > 1:
+      regions = [(selector.getName(), self.getOutputBox(selector)) for selector in self.selectors]
+      self.saver.putRegions(self.imagepath, regions, self.output_format, self.quality, self.output_sizes)
+    else:
+      self.saver.put(self.imagepath, self.getOutputBox(), self.output_format, self.quality, self.output_sizes)
+    if self.saver.pending() > 1:
+      self.showInfoMessage('Saving (' + str(self.saver.pending()) + ' queued)', None)
+    else:
+      self.showInfoMessage('Saving...', None)
+
+  def getOutputBox(self, selector=None):
+    x, y, width, height = self.getSelectionBox(selector)
+    return int(x), int(y), int(x+width), int(y+height)
+
+  def onSaveCompleted(self, savepaths, error):
+    # called from the save thread
+    GLib.idle_add(self.showSaveResult, savepaths, error)
+
+  def showSaveResult(self, savepaths, error):
+    if error is not None:
+      self.showInfoMessage('Error saving image: ' + str(error))
+      return False
+    savename = os.path.basename(savepaths[0])
+    if len(savepaths) > 1:
+      savename += ' and ' + str(len(savepaths) - 1) + ' more'
+    if self.saver.pending() > 0:
+      self.showInfoMessage('Image saved as ' + savename + ' (' + str(self.saver.pending()) + ' queued)', None)
+    else:
+      self.showInfoMessage('Image saved as ' + savename)
+    return False
+
+  ## SELECTORS
+  def getSelectorAt(self, x, y):
+    # the active selector, or else the topmost one under the point
+    if self.selector.isPositionInternal(x, y):
+      return self.selector
+    for selector in reversed(self.selectors):
+      if selector.isPositionInternal(x, y):
+        return selector
+    return None
+
+  def activateSelector(self, selector):
+    # the active selector is the one resized, trimmed and applied
+    self.selector.setActive(False)
+    self.selector = selector
+    self.selector.setActive(True)
+
+  def addSelector(self, *args):
+    # a copy of the active selector, a little lower and to the right
+    self.selector_count += 1
+    selector = Selector(self, str(self.selector_count))
+    selector.setSizeMax(*self.getZoomedSize())
+    selector.setRatio(*self.selector.getRatio())
+    selector.fixRatio(self.selector.getFixRatio())
+    selector.setColour(self.selector.getColour())
+    x, y, width, height = self.selector.getBox()
+    selector.setSize(width, height)
+    selector.move(x + NEW_SELECTOR_OFFSET, y + NEW_SELECTOR_OFFSET)
+    self.selectors.append(selector)
+    self.activateSelector(selector)
+    # the names are only shown with several selectors
+    self.builder.get_object('Canvas').queue_draw()
+
+  def removeSelector(self, *args):
+    if len(self.selectors) == 1:
+      return
+    self.selector.queueDraw()
+    self.selectors.remove(self.selector)
+    self.selector = self.selectors[-1]
+    self.selector.setActive(True)
+    self.builder.get_object('Canvas').queue_draw()
+
+  def nextSelector(self, *args):
+    index = self.selectors.index(self.selector)
+    self.activateSelector(self.selectors[(index + 1) % len(self.selectors)])
+
+  ## AUTO CROP
+  def trimSelection(self, *args):
+    # place the selector on the image without its uniform borders; they
+    # are searched on a worker thread, as the source may have to be
+    # decoded
+    if self.pyramid is None:
+      return
+    preview = self.pyramid.getPreview(self.fit_zoom)
+    args = (self.imagepath, preview, self.selector)
+    thread = threading.Thread(target=self.runTrim, args=args, daemon=True)
+    thread.start()
+
+  @Profiling.timed('interface.trim')
+  def runTrim(self, imagepath, preview, selector):
+    # NumPy is only loaded once an automatic crop is asked for
+    from src import AutoCrop
+    try:
+      box = AutoCrop.findContentBox(imagepath, preview)
+      error = None
+    except Exception as e:
+      box = None
+      error = e
+    GLib.idle_add(self.showTrimResult, imagepath, selector, box, error)
+
+  def showTrimResult(self, imagepath, selector, box, error):
+    if imagepath != self.imagepath or not selector in self.selectors:
+      # the image or the selectors changed meanwhile
+      return False
+    if error is not None:
+      self.showInfoMessage('Error trimming image: ' + str(error))
+    elif box is None:
+      self.showInfoMessage('No content found')
+    else:
+      left, top, right, bottom = box
+      self.setSelectionBox(left, top, right - left, bottom - top, selector)
+    return False
 
+  @Profiling.timed('interface.smart_crop')
+  def smartSelection(self, *args):
+    # move the selector, keeping its size, to the most detailed part
+    if self.pyramid is None:
+      return
+    _, _, width, height = self.getSelectionBox()
+    from src import AutoCrop
+    preview = self.pyramid.getPreview(self.fit_zoom)
+    try:
+      left, top, right, bottom = AutoCrop.findSmartBox(self.imagepath, (width, height), preview)
+    except Exception as e:
+      self.showInfoMessage('Error finding the crop: ' + str(e))
+      return
+    self.setSelectionBox(left, top, right - left, bottom - top)
+
+  ## APPLY TO IMAGES
+  def getNormalizedBox(self):
+    # selection relative to the image size, the same for any image size
+    x, y, width, height = self.getSelectionBox()
+    return x / self.image_width, y / self.image_height, width / self.image_width, height / self.image_height
+
+  def chooseImages(self):
+    dialog = Gtk.FileChooserDialog(title='Apply the crop to', parent=self.main_window, action=Gtk.FileChooserAction.OPEN)
+    dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 'Apply', Gtk.ResponseType.OK)
+    dialog.set_select_multiple(True)
+    dialog.set_current_folder(os.path.dirname(os.path.abspath(self.imagepath)))
+    image_filter = Gtk.FileFilter()
+    image_filter.set_name('Images')
+    image_filter.add_pixbuf_formats()
+    dialog.add_filter(image_filter)
+    if dialog.run() == Gtk.ResponseType.OK:
+      paths = dialog.get_filenames()
+    else:
+      paths = []
+    dialog.destroy()
+    return paths
+
+  def applyToImages(self, *args):
+    if self.applying:
+      return
+    paths = self.chooseImages()
+    if len(paths) == 0:
+      return
+    normalized_box = self.getNormalizedBox()
+    if self.selector.getFixRatio():
+      ratio = self.selector.getRatio()
+    else:
+      ratio = None
+    self.applying = True
+    self.showInfoMessage('Cropping 0/' + str(len(paths)), None)
+    args = (paths, normalized_box, ratio, self.output_format, self.quality)
+    thread = threading.Thread(target=self.runApply, args=args, daemon=True)
+    thread.start()
+
+  def runApply(self, paths, normalized_box, ratio, output_format, quality):
+    # errors of single images are counted by applyBox; anything else stops
+    # the whole run, which must not stay marked as running
+    try:
+      Batch.applyBox(paths, normalized_box, ratio, output_format, quality, callback=self.onApplyProgress)
+    except Exception as e:
+      GLib.idle_add(self.showInfoMessage, 'Error applying the crop: ' + str(e))
+    finally:
+      GLib.idle_add(self.stopApplying)
+
+  def stopApplying(self):
+    self.applying = False
+    return False
+
+  def onApplyProgress(self, done, total, failed):
+    # called from the apply thread
+    GLib.idle_add(self.showApplyProgress, done, total, failed)
+
+  def showApplyProgress(self, done, total, failed):
+    message = 'Cropping ' + str(done) + '/' + str(total)
+    if failed > 0:
+      message += ' (' + str(failed) + ' failed)'
+    if done < total:
+      self.showInfoMessage(message, None)
+    else:
+      self.showInfoMessage(message.replace('Cropping', 'Cropped'))
+    return False
 
 def start(*args, **kwargs):
   interface = Interface(*args, **kwargs)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import csv
+import hashlib
+import json
+import os
+import sys
+
+from src import Batch
+from src import Crop
+
+MANIFEST_EXTENSIONS = ('.jsonl', '.csv')
+JOURNAL_EXTENSION = '.journal'
+
+# journal records written between two syncs to disk
+JOURNAL_SYNC = 256
+
+## MANIFEST
+# One crop per JSON line or CSV row (with a header), the fields being
+# those of the batch options: path, box (x,y,width,height) or ratio,
+# scale, auto, format, quality, sizes and output. Paths are relative to
+# the manifest. A box measured on a preview scaled by scale is divided by
+# it, as the GUI did with its scale factor.
+
+def isManifest(path):
+  _, extension = os.path.splitext(path)
+  return extension.lower() in MANIFEST_EXTENSIONS
+
+def readRows(manifest):
+  # (line number, fields) of each entry, read lazily; JSON lines are
+  # decoded by readJobs, so that a broken line is only one invalid entry
+  _, extension = os.path.splitext(manifest)
+  with open(manifest, 'r', newline='') as hand:
+    if extension.lower() == '.csv':
+      reader = csv.DictReader(hand)
+      for row in reader:
+        fields = {key.strip(): value.strip() for key, value in row.items() if key is not None and value is not None and value.strip() != ''}
+        yield reader.line_num, fields
+    else:
+      for number, line in enumerate(hand, 1):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+          continue
+        yield number, line
+
+def joinValues(value):
+  # JSON lists are written as on the command line
+  if isinstance(value, (list, tuple)):
+    return ','.join(['full' if item is None else str(item) for item in value])
+  return str(value)
+
+def scaleBox(box, scale):
+  if scale <= 0:
+    raise ValueError('Invalid scale: ' + str(scale))
+  x, y, width, height = box
+  left, top = int(x / scale), int(y / scale)
+  right, bottom = int((x + width) / scale), int((y + height) / scale)
+  return left, top, right - left, bottom - top
+
+def parseEntry(fields, folder, defaults):
+  path = fields['path']
+  if not os.path.isabs(path):
+    path = os.path.join(folder, path)
+  box, ratio, auto = defaults['box'], defaults['ratio'], defaults['auto']
+  if 'box' in fields or 'ratio' in fields or 'auto' in fields:
+    # the entry's own crop replaces the default one
+    box, ratio, auto = None, None, fields.get('auto')
+    if 'box' in fields:
+      box = Batch.parseBox(joinValues(fields['box']))
+      if 'scale' in fields:
+        box = scaleBox(box, float(fields['scale']))
+    if 'ratio' in fields:
+      ratio = fields['ratio']
+      if isinstance(ratio, (list, tuple)):
+        ratio = ':'.join([str(value) for value in ratio])
+      ratio = Batch.parseRatio(ratio)
+    if not auto in (None, Batch.AUTO_TRIM, Batch.AUTO_SMART):
+      raise ValueError('Invalid automatic crop: ' + str(auto))
+  output = fields.get('output')
+  if output is not None and not os.path.isabs(output):
+    output = os.path.join(folder, output)
+  job = Batch.makeJob(path, box, ratio, auto, output)
+  output_format = fields.get('format', defaults['format'])
+  if not output_format in Crop.OUTPUT_FORMATS:
+    raise ValueError('Invalid format: ' + str(output_format))
+  quality = int(fields.get('quality', defaults['quality']))
+  sizes = defaults['sizes']
+  if 'sizes' in fields:
+    sizes = Batch.parseSizes(joinValues(fields['sizes']))
+  Batch.setOutput([job], output_format, quality, sizes)
+  return job
+
+def readJobs(manifest, defaults, output=sys.stdout, counts=None):
+  # invalid entries are reported, counted and skipped
+  folder = os.path.dirname(os.path.abspath(manifest))
+  for number, fields in readRows(manifest):
+    try:
+      if isinstance(fields, str):
+        fields = json.loads(fields)
+      job = parseEntry(fields, folder, defaults)
+    except (KeyError, TypeError, ValueError) as e:
+      output.write('%s:%d: ERROR invalid entry: %s\n' % (manifest, number, e))
+      if counts is not None:
+        counts['invalid'] += 1
+      continue
+    yield job
+
+def groupConsecutive(jobs):
+  # consecutive crops of the same source run on the same worker
+  group = []
+  for job in jobs:
+    if len(group) > 0 and group[0]['path'] != job['path']:
+      yield group
+      group = []
+    group.append(job)
+  if len(group) > 0:
+    yield group
+
+## JOURNAL
+def getJobKey(job):
+  # changes with the source file and with any parameter of the crop;
+  # None when the source can't be read
+  try:
+    stat = os.stat(job['path'])
+  except OSError:
+    return None
+  ratio = job['ratio']
+  if ratio is not None:
+    ratio = [str(value) for value in ratio]
+  params = [os.path.abspath(job['path']), stat.st_mtime_ns, stat.st_size,
+            job['box'], ratio, job['auto'], job['output'],
+            job['format'], job['quality'], job['sizes']]
+  return hashlib.sha1(json.dumps(params).encode('utf-8')).hexdigest()
+
+# Completed crops, one JSON line each, appended as they complete: a run
+# restarted after a crash skips the entries already done with the same
+# source and parameters.
+class Journal():
+
+  def __init__(self, path):
+    self.path = path
+    self.keys = self.load()
+    self.hand = open(path, 'a')
+    self.unsynced = 0
+
+  def load(self):
+    keys = set()
+    if not os.path.exists(self.path):
+      return keys
+    with open(self.path, 'rb+') as hand:
+      data = hand.read()
+      # a line cut by a crash is dropped, so that the next record starts
+      # on a line of its own
+      end = data.rfind(b'\n') + 1
+      if end < len(data):
+        hand.truncate(end)
+    for line in data[:end].splitlines():
+      try:
+        keys.add(json.loads(line)['key'])
+      except (ValueError, KeyError, TypeError):
+        continue
+    return keys
+
+  def isDone(self, key):
+    return key is not None and key in self.keys
+
+  def record(self, job, savepaths):
+    if job.get('key') is None:
+      return
+    self.hand.write(json.dumps({'key': job['key'], 'path': job['path'], 'savepaths': savepaths}) + '\n')
+    self.hand.flush()
+    self.keys.add(job['key'])
+    self.unsynced += 1
+    if self.unsynced >= JOURNAL_SYNC:
+      os.fsync(self.hand.fileno())
+      self.unsynced = 0
+
+  def close(self):
+    self.hand.flush()
+    os.fsync(self.hand.fileno())
+    self.hand.close()
+
+def start(manifest, defaults, workers=None, output=sys.stdout):
+  journal = Journal(manifest + JOURNAL_EXTENSION)
+  counts = {'invalid': 0, 'skipped': 0}
+  def getPending():
+    for job in readJobs(manifest, defaults, output, counts):
+      job['key'] = getJobKey(job)
+      if journal.isDone(job['key']):
+        counts['skipped'] += 1
+        continue
+      yield job
+  try:
+    success = Batch.run(groupConsecutive(getPending()), workers, output, journal)
+  finally:
+    journal.close()
+  if counts['skipped'] > 0:
+    output.write('Skipped %d entries already done (%s)\n' % (counts['skipped'], journal.path))
+  if counts['invalid'] > 0:
+    output.write('%d invalid entries\n' % counts['invalid'])
+  return success and counts['invalid'] == 0
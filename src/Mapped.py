@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import re
+
+from PIL import Image
+from PIL import ImageFile
+
+from src import Profiling
+
+## MAPPED CROPS
+# Uncompressed sources (binary PPM/PGM, uncompressed TIFF in one strip or
+# many, and raw dumps) are mapped in memory and the crop is copied out of
+# the mapping: only the pages under the box are read, so a crop of a scan
+# of several gigabytes costs about the size of the crop.
+
+# modes whose raw bytes are the same in the file and in PIL
+MAPPED_MODES = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
+# raw dumps have no header: the size is in the file name, as in
+# scan.6000x4000.rgb
+RAW_EXTENSIONS = {'.gray': 'L', '.rgb': 'RGB', '.rgba': 'RGBA'}
+RAW_SIZE = re.compile(r'\.(\d+)x(\d+)$')
+
+## RAW DUMPS
+def isRawDump(imagepath):
+  _, extension = os.path.splitext(imagepath)
+  return extension.lower() in RAW_EXTENSIONS
+
+class RawImageFile(ImageFile.ImageFile):
+
+  format = 'RAW'
+  format_description = 'Raw pixel dump'
+
+  def _open(self):
+    name, extension = os.path.splitext(self.filename)
+    match = RAW_SIZE.search(name)
+    if match is None:
+      raise SyntaxError('No size in the name of the raw dump: ' + self.filename)
+    width, height = int(match.group(1)), int(match.group(2))
+    mode = RAW_EXTENSIONS[extension.lower()]
+    self.fp.seek(0, os.SEEK_END)
+    if self.fp.tell() != width * height * MAPPED_MODES[mode]:
+      raise SyntaxError('The size of the raw dump does not match its name: ' + self.filename)
+    self.fp.seek(0)
+    self._size = (width, height)
+    self._mode = mode
+    self.tile = [('raw', (0, 0, width, height), 0, (mode, 0, 1))]
+
+## LAYOUT
+def getLayout(image):
+  # (strips, bands) when the pixels can be mapped, None otherwise; strips
+  # are (top, bottom, offset, row stride) from the top of the image to
+  # the bottom: one for PPM and raw dumps, one per strip of rows for TIFF
+  if not image.mode in MAPPED_MODES or len(image.tile) == 0 or not getattr(image, 'filename', None):
+    return None
+  width, height = image.size
+  bands = MAPPED_MODES[image.mode]
+  strips = []
+  for tile in sorted(image.tile, key=lambda tile: tile[1][1]):
+    left, top, right, bottom = tile[1]
+    # full rows, each strip starting where the previous one ends
+    end = strips[-1][1] if len(strips) > 0 else 0
+    if tile[0] != 'raw' or left != 0 or right != width or top != end or bottom <= top:
+      return None
+    args = tile[3]
+    if isinstance(args, str):
+      args = (args,)
+    rawmode = args[0]
+    stride = args[1] if len(args) > 1 else 0
+    orientation = args[2] if len(args) > 2 else 1
+    if rawmode != image.mode or orientation != 1:
+      return None
+    if stride == 0:
+      stride = width * bands
+    strips.append((top, bottom, tile[2], stride))
+  if strips[-1][1] != height:
+    return None
+  file_size = os.path.getsize(image.filename)
+  for top, bottom, offset, stride in strips:
+    if file_size < offset + (bottom - top) * stride:
+      # truncated file: let PIL report it
+      return None
+  return strips, bands
+
+def containsBox(size, box):
+  left, top, right, bottom = box
+  return left >= 0 and top >= 0 and right <= size[0] and bottom <= size[1] and left < right and top < bottom
+
+@Profiling.timed('crop.mapped')
+def cropMapped(imagepath, size, layout, box):
+  # (NumPy is imported here, as the formats that can't be mapped don't need it)
+  import numpy
+  strips, bands = layout
+  width, _ = size
+  left, top, right, bottom = box
+  region = numpy.empty((bottom - top, right - left, bands), dtype=numpy.uint8)
+  with open(imagepath, 'rb') as hand:
+    with mmap.mmap(hand.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+      for strip_top, strip_bottom, offset, stride in strips:
+        first, last = max(top, strip_top), min(bottom, strip_bottom)
+        if first >= last:
+          continue
+        pixels = numpy.ndarray((strip_bottom - strip_top, width, bands), dtype=numpy.uint8, buffer=mapped,
+                               offset=offset, strides=(stride, bands, 1))
+        # the copy is the only read of the file
+        region[first - top:last - top] = pixels[first - strip_top:last - strip_top, left:right]
+        # no view may outlive the mapping
+        del pixels
+  if bands == 1:
+    region = region.reshape(region.shape[:2])
+  return Image.fromarray(region)
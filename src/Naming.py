@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import tempfile
+import threading
+
+OUTPUT_SUFFIX = '.resized'
+
+def getOutputName(basename, index, extension):
+  # index 0 is name.resized.ext, then name.resized-1.ext, ...
+  if index == 0:
+    return basename + OUTPUT_SUFFIX + extension
+  else:
+    return basename + OUTPUT_SUFFIX + '-' + str(index) + extension
+
+# name.resized-3.512px.png: basename, index and extension
+OUTPUT_NAME = re.compile(r'^(.*)' + re.escape(OUTPUT_SUFFIX) + r'(?:-(\d+))?(.*)$')
+
+## NAME ALLOCATOR
+# Output names are claimed by creating the file with O_EXCL, so parallel
+# savers (threads or processes) never get the same one. Each folder is
+# scanned once, then the highest index of each source name and extension
+# is kept in memory.
+class NameAllocator():
+
+  def __init__(self):
+    # folder: {(basename, extension): highest index}
+    self.folders = {}
+    self.lock = threading.Lock()
+
+  def scan(self, folder):
+    indexes = {}
+    with os.scandir(folder) as entries:
+      for entry in entries:
+        match = OUTPUT_NAME.match(entry.name)
+        if match is None:
+          continue
+        key = (match.group(1), match.group(3))
+        index = int(match.group(2)) if match.group(2) is not None else 0
+        if index > indexes.get(key, -1):
+          indexes[key] = index
+    return indexes
+
+  def create(self, folder, basename, index, extensions):
+    # all the names with this index, or none of them
+    savepaths = []
+    for extension in extensions:
+      savepath = os.path.join(folder, getOutputName(basename, index, extension))
+      try:
+        hand = os.open(savepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+      except FileExistsError:
+        # created by someone else since the scan
+        for path in savepaths:
+          os.remove(path)
+        return None
+      os.close(hand)
+      savepaths.append(savepath)
+    return savepaths
+
+  def claim(self, imagepath, extensions):
+    # one index free for every extension, e.g. the sizes of a crop:
+    # name.resized-2.png, name.resized-2.512px.png, ...
+    folder = os.path.dirname(os.path.abspath(imagepath))
+    basename, _ = os.path.splitext(os.path.basename(imagepath))
+    with self.lock:
+      indexes = self.folders.get(folder)
+      if indexes is None:
+        indexes = self.scan(folder)
+        self.folders[folder] = indexes
+      index = max([indexes.get((basename, extension), -1) for extension in extensions]) + 1
+      while True:
+        savepaths = self.create(folder, basename, index, extensions)
+        if savepaths is not None:
+          break
+        index += 1
+      for extension in extensions:
+        indexes[(basename, extension)] = index
+      return savepaths
+
+  def forget(self):
+    with self.lock:
+      self.folders.clear()
+
+# names claimed by this process
+ALLOCATOR = NameAllocator()
+
+def claimSavePath(imagepath, extension):
+  return ALLOCATOR.claim(imagepath, [extension])[0]
+
+def claimSavePaths(imagepath, extensions):
+  return ALLOCATOR.claim(imagepath, extensions)
+
+def claimPath(savepath):
+  # an output name chosen by the caller, replaced if it exists; missing
+  # folders are created
+  folder = os.path.dirname(savepath)
+  if folder != '':
+    os.makedirs(folder, exist_ok=True)
+  hand = os.open(savepath, os.O_CREAT | os.O_WRONLY, 0o666)
+  os.close(hand)
+  return savepath
+
+def writeAtomic(savepath, write):
+  # write(path) writes to a temporary file that then replaces the claimed
+  # (empty) output, so readers never see a partial file
+  folder = os.path.dirname(savepath)
+  hand, temppath = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=folder)
+  os.close(hand)
+  try:
+    write(temppath)
+    # keep the permissions of the claimed file (mkstemp uses 0600)
+    os.chmod(temppath, os.stat(savepath).st_mode)
+    os.replace(temppath, savepath)
+  except BaseException:
+    if os.path.exists(temppath):
+      os.remove(temppath)
+    # the empty name claimed for this write goes, an earlier output
+    # replaced by it stays
+    if os.path.exists(savepath) and os.path.getsize(savepath) == 0:
+      os.remove(savepath)
+    raise
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import atexit
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+# profile output (JSON) and optional cProfile output, when not set by
+# the --profile and --cprofile options
+ENV_PROFILE = 'IMAGE_CROP_PROFILE'
+ENV_CPROFILE = 'IMAGE_CROP_CPROFILE'
+
+# histogram buckets hold durations up to 1 us, 2 us, 4 us, ... 2^26 us (67 s)
+BUCKETS = 27
+PERCENTILES = (50, 90, 99)
+
+## HISTOGRAM
+class Histogram():
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+    self.buckets = [0] * BUCKETS
+
+  def add(self, seconds):
+    # frexp: microseconds < 2^exponent
+    _, exponent = math.frexp(seconds * 1e6)
+    self.buckets[min(max(exponent, 0), BUCKETS - 1)] += 1
+    self.count += 1
+    self.total += seconds
+    self.min = seconds if self.min is None else min(self.min, seconds)
+    self.max = seconds if self.max is None else max(self.max, seconds)
+
+  def getPercentile(self, percentile):
+    # upper bound of the bucket holding the percentile
+    target = self.count * percentile / 100
+    seen = 0
+    for index, count in enumerate(self.buckets):
+      seen += count
+      if seen >= target:
+        return min(2 ** index / 1e6, self.max)
+    return self.max
+
+  def toDict(self):
+    result = {'count': self.count,
+              'total_ms': self.total * 1000,
+              'mean_ms': self.total * 1000 / self.count,
+              'min_ms': self.min * 1000,
+              'max_ms': self.max * 1000}
+    for percentile in PERCENTILES:
+      result['p' + str(percentile) + '_ms'] = self.getPercentile(percentile) * 1000
+    result['histogram_us'] = {str(2 ** index): count for index, count in enumerate(self.buckets) if count > 0}
+    return result
+
+## PROFILER
+# Durations of each stage and rates of each event, recorded from any
+# thread and written as JSON when the process exits.
+class Profiler():
+
+  def __init__(self, path, cprofile_path=None):
+    self.path = path
+    self.cprofile_path = cprofile_path
+    self.stages = {}
+    self.events = {}
+    self.lock = threading.Lock()
+    self.start = time.perf_counter()
+    self.cprofile = None
+    if cprofile_path is not None:
+      # only the main thread is profiled
+      import cProfile
+      self.cprofile = cProfile.Profile()
+      self.cprofile.enable()
+
+  def record(self, stage, seconds):
+    with self.lock:
+      histogram = self.stages.get(stage)
+      if histogram is None:
+        histogram = Histogram()
+        self.stages[stage] = histogram
+      histogram.add(seconds)
+
+  def count(self, event):
+    now = time.perf_counter()
+    with self.lock:
+      item = self.events.get(event)
+      if item is None:
+        self.events[event] = {'count': 1, 'first': now, 'last': now, 'intervals': Histogram()}
+        return
+      item['intervals'].add(now - item['last'])
+      item['count'] += 1
+      item['last'] = now
+
+  def getVersions(self):
+    versions = {'python': sys.version.split()[0]}
+    if 'PIL' in sys.modules:
+      versions['pil'] = sys.modules['PIL'].__version__
+    if 'numpy' in sys.modules:
+      versions['numpy'] = sys.modules['numpy'].__version__
+    if 'gi.repository.Gtk' in sys.modules:
+      Gtk = sys.modules['gi.repository.Gtk']
+      versions['gtk'] = '%d.%d.%d' % (Gtk.get_major_version(), Gtk.get_minor_version(), Gtk.get_micro_version())
+    return versions
+
+  def toDict(self):
+    with self.lock:
+      stages = {stage: histogram.toDict() for stage, histogram in sorted(self.stages.items())}
+      events = {}
+      for event, item in sorted(self.events.items()):
+        duration = item['last'] - item['first']
+        events[event] = {'count': item['count'],
+                         'rate_hz': (item['count'] - 1) / duration if duration > 0 else 0}
+        if item['intervals'].count > 0:
+          events[event]['intervals'] = item['intervals'].toDict()
+    return {'versions': self.getVersions(),
+            'duration_s': time.perf_counter() - self.start,
+            'stages': stages,
+            'events': events}
+
+  def dump(self):
+    if self.cprofile is not None:
+      self.cprofile.disable()
+      self.cprofile.dump_stats(self.cprofile_path)
+    with open(self.path, 'w') as hand:
+      json.dump(self.toDict(), hand, indent=2)
+    sys.stderr.write('Profile written to %s\n' % self.path)
+
+PROFILER = None
+
+def enable(path, cprofile_path=None):
+  global PROFILER
+  if PROFILER is not None:
+    return
+  PROFILER = Profiler(path, cprofile_path)
+  atexit.register(PROFILER.dump)
+
+def setup(path=None, cprofile_path=None):
+  # options first, then the environment; must run before the modules to
+  # profile are imported, since @timed only wraps when enabled
+  path = path or os.environ.get(ENV_PROFILE)
+  cprofile_path = cprofile_path or os.environ.get(ENV_CPROFILE)
+  if path is None and cprofile_path is not None:
+    path = os.path.splitext(cprofile_path)[0] + '.json'
+  if path is not None:
+    enable(path, cprofile_path)
+
+def isEnabled():
+  return PROFILER is not None
+
+## RECORDING
+# All of these do nothing (or return the function as it is) when
+# profiling is not enabled.
+def record(stage, seconds):
+  if PROFILER is not None:
+    PROFILER.record(stage, seconds)
+
+def count(event):
+  if PROFILER is not None:
+    PROFILER.count(event)
+
+class Timer():
+
+  def __init__(self, stage):
+    self.stage = stage
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *args):
+    PROFILER.record(self.stage, time.perf_counter() - self.start)
+    return False
+
+def timer(stage):
+  # with timer('stage'): ...
+  if PROFILER is None:
+    return nullcontext()
+  return Timer(stage)
+
+def timed(stage):
+  # decorator recording the duration of each call
+  def decorate(function):
+    if PROFILER is None:
+      return function
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        PROFILER.record(stage, time.perf_counter() - start)
+    return wrapper
+  return decorate
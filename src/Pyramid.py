@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from src import Crop
+from src import Mapped
+from src import Profiling
+from src.Cache import getImageBytes
+
+TILE_SIZE = 256
+
+DEFAULT_PYRAMID_SIZE = 128 * 1024 * 1024
+
+# largest JPEG DCT scaling
+MAX_DRAFT_SCALE = 8
+
+# largest decode of the whole source (down to the rows of a tile for
+# JPEG), as a multiple of the budget
+MAX_DECODE_FACTOR = 4
+
+def normalizeMode(image):
+  # tiles are always RGB or RGBA
+  if image.mode in ('RGB', 'RGBA'):
+    return image
+  if image.mode in ('LA', 'PA') or 'transparency' in image.info:
+    return image.convert('RGBA')
+  return image.convert('RGB')
+
+## TILE PYRAMID
+# Level n holds the image scaled by 1/2^n, cut in TILE_SIZE tiles that are
+# decoded on demand and kept in a LRU cache with a memory budget. Levels
+# small enough are decoded as a whole (JPEG sources use DCT scaling).
+# Finer levels of sources with strips, tiles or mapped pixels are decoded
+# one row of tiles at a time from the region of the source they cover;
+# the other sources (JPEG, PNG, compressed TIFF) are decoded top to
+# bottom, so every row of the level is cut from a single decode. Those
+# decodes are bounded: JPEG levels finer than the bound are not used, and
+# the other formats are refused when they can't be decoded whole.
+class TilePyramid():
+
+  def __init__(self, imagepath, max_bytes=DEFAULT_PYRAMID_SIZE, convert=None):
+    self.imagepath = imagepath
+    self.max_bytes = max_bytes
+    # convert(tile) turns the PIL tiles into what the caller draws
+    self.convert = convert
+    with Crop.openSource(imagepath) as image:
+      self.width, self.height = image.size
+      self.format = image.format
+      # whether a row of tiles can be decoded without the rows above it
+      self.seekable = len(image.tile) > 1 or Mapped.getLayout(image) is not None
+    largest = max(self.width, self.height)
+    self.levels = max(int(math.ceil(math.log2(largest / TILE_SIZE))), 0) + 1
+    self.first_level = self.getFirstLevel()
+    if self.first_level is None:
+      raise ValueError('Too large to be decoded whole: ' + imagepath)
+    self.size = 0
+    self.tiles = OrderedDict()
+    self.lock = threading.Lock()
+    # tiles to decode on the loader thread: key -> callback
+    self.requests = {}
+    self.loading = False
+
+  # GET
+  def getSize(self):
+    return self.width, self.height
+
+  def getLevelScale(self, level):
+    return 2 ** level
+
+  def getLevelSize(self, level):
+    scale = self.getLevelScale(level)
+    return int(math.ceil(self.width / scale)), int(math.ceil(self.height / scale))
+
+  def getLevel(self, zoom):
+    # coarsest level with at least one pixel per screen pixel
+    if zoom >= 1:
+      return self.first_level
+    level = int(math.floor(math.log2(1 / zoom)))
+    return min(max(level, self.first_level), self.levels - 1)
+
+  def getFirstLevel(self):
+    # finest level decoded within the bound, None when there is none
+    if self.seekable:
+      return 0
+    max_decode = self.max_bytes * MAX_DECODE_FACTOR
+    for level in range(self.levels):
+      scale = min(self.getLevelScale(level), MAX_DRAFT_SCALE) if self.format == 'JPEG' else 1
+      decode_size = (int(math.ceil(self.width / scale)), int(math.ceil(self.height / scale)))
+      if getImageBytes(decode_size, 'RGB') <= max_decode:
+        return level
+    return None
+
+  def getTileRange(self, level, box):
+    # tiles of the level covering a box in full resolution coordinates
+    left, top, right, bottom = box
+    span = TILE_SIZE * self.getLevelScale(level)
+    level_width, level_height = self.getLevelSize(level)
+    columns = int(math.ceil(level_width / TILE_SIZE))
+    rows = int(math.ceil(level_height / TILE_SIZE))
+    first_x = min(max(int(left // span), 0), columns - 1)
+    first_y = min(max(int(top // span), 0), rows - 1)
+    last_x = min(max(int(math.ceil(right / span)), first_x + 1), columns)
+    last_y = min(max(int(math.ceil(bottom / span)), first_y + 1), rows)
+    return range(first_x, last_x), range(first_y, last_y)
+
+  def getTileBox(self, level, tile_x, tile_y):
+    # tile extents in level coordinates
+    level_width, level_height = self.getLevelSize(level)
+    left = tile_x * TILE_SIZE
+    top = tile_y * TILE_SIZE
+    return left, top, min(left + TILE_SIZE, level_width), min(top + TILE_SIZE, level_height)
+
+  def getTile(self, level, tile_x, tile_y):
+    key = (level, tile_x, tile_y)
+    tile = self.cacheGet(key)
+    if tile is not None:
+      return tile
+    if self.isLevelCached(level):
+      level_image = self.getLevelImage(level)
+      image = level_image.crop(self.getTileBox(level, tile_x, tile_y))
+      return self.cachePut(key, image)
+    if self.seekable:
+      row = self.loadTileRow(level, tile_y)
+    else:
+      row = self.loadLevelRows(level, tile_y)
+    return row[tile_x]
+
+  def findTile(self, level, tile_x, tile_y):
+    # the tile if it can be had without decoding, None otherwise
+    key = (level, tile_x, tile_y)
+    tile = self.cacheGet(key)
+    if tile is None and self.isLevelCached(level):
+      level_image = self.cacheGet(('level', level))
+      if level_image is not None:
+        tile = self.cachePut(key, level_image.crop(self.getTileBox(level, tile_x, tile_y)))
+    return tile
+
+  def requestTile(self, level, tile_x, tile_y, callback):
+    # decode a tile on the loader thread, callback() is called from it
+    # once the tile is cached; the thread ends when no request is left
+    key = (level, tile_x, tile_y)
+    with self.lock:
+      if key in self.requests:
+        return
+      self.requests[key] = callback
+      if self.loading:
+        return
+      self.loading = True
+    threading.Thread(target=self.loadRequests, daemon=True).start()
+
+  def loadRequests(self):
+    while True:
+      with self.lock:
+        if len(self.requests) == 0:
+          self.loading = False
+          return
+        # latest first: the view may have moved away from the oldest
+        key, callback = self.requests.popitem()
+      try:
+        self.getTile(*key)
+      except Exception:
+        # not drawn: a callback would only request it again
+        continue
+      callback()
+
+  def loadView(self, zoom):
+    # decode every tile shown when the whole image is seen at zoom
+    level = self.getLevel(zoom)
+    columns, rows = self.getTileRange(level, (0, 0, self.width, self.height))
+    for tile_y in rows:
+      for tile_x in columns:
+        self.getTile(level, tile_x, tile_y)
+
+  def getPreview(self, zoom):
+    # (image, scale factor) of the whole level shown at zoom, None when
+    # the level is only kept as tiles
+    level = self.getLevel(zoom)
+    if not self.isLevelCached(level):
+      return None
+    image = self.getLevelImage(level)
+    return image, image.size[0] / self.width
+
+  # CACHE
+  def cacheGet(self, key):
+    with self.lock:
+      item = self.tiles.get(key)
+      if item is None:
+        return None
+      self.tiles.move_to_end(key)
+      return item[0]
+
+  def cachePut(self, key, image, convert=True):
+    image_bytes = getImageBytes(image.size, image.mode)
+    if convert and self.convert is not None:
+      item = self.convert(image)
+    else:
+      item = image
+    with self.lock:
+      if key in self.tiles:
+        self.size -= self.tiles.pop(key)[1]
+      self.tiles[key] = (item, image_bytes)
+      self.size += image_bytes
+      while self.size > self.max_bytes and len(self.tiles) > 1:
+        _, old = self.tiles.popitem(last=False)
+        self.size -= old[1]
+    return item
+
+  def clear(self):
+    with self.lock:
+      self.tiles.clear()
+      self.size = 0
+
+  # DECODE
+  def isLevelCached(self, level):
+    # whole levels only take a fraction of the budget, unless the tile
+    # rows are cut from a decode of the whole source anyway
+    level_bytes = getImageBytes(self.getLevelSize(level), 'RGB')
+    if self.seekable:
+      return level_bytes * 4 <= self.max_bytes
+    else:
+      return level_bytes * 2 <= self.max_bytes
+
+  def getLevelImage(self, level):
+    key = ('level', level)
+    image = self.cacheGet(key)
+    if image is None:
+      image = self.decodeLevel(level)
+      self.cachePut(key, image, False)
+    return image
+
+  @Profiling.timed('pyramid.decode_level')
+  def decodeLevel(self, level):
+    level_size = self.getLevelSize(level)
+    # halve the next finer level when it is already decoded
+    finer = self.cacheGet(('level', level - 1))
+    if finer is not None:
+      return finer.reduce(2)
+    image = Crop.openSource(self.imagepath)
+    if image.format == 'JPEG':
+      # DCT scaling
+      scale = min(self.getLevelScale(level), MAX_DRAFT_SCALE)
+      image.draft(image.mode, (int(math.ceil(self.width / scale)), int(math.ceil(self.height / scale))))
+    elif self.seekable:
+      # strips, tiles or mapped pixels: never hold the whole source
+      image.close()
+      return self.decodeBands(level)
+    image = normalizeMode(image)
+    if image.size != level_size:
+      image = image.resize(level_size, Image.BILINEAR)
+    return image
+
+  def decodeBands(self, level):
+    scale = self.getLevelScale(level)
+    level_width, level_height = self.getLevelSize(level)
+    # bands of source rows taking a quarter of the budget, multiple of the scale
+    rows = int(self.max_bytes / 4 / getImageBytes((self.width, 1), 'RGB'))
+    rows = max(int(rows / scale), 1)
+    image = None
+    for top in range(0, level_height, rows):
+      bottom = min(top + rows, level_height)
+      box = (0, top * scale, self.width, min(bottom * scale, self.height))
+      band = normalizeMode(Crop.openRegion(self.imagepath, box))
+      if image is None:
+        image = Image.new(band.mode, (level_width, level_height))
+      band = band.resize((level_width, bottom - top), Image.BILINEAR)
+      image.paste(band, (0, top))
+    return image
+
+  @Profiling.timed('pyramid.decode_row')
+  def loadTileRow(self, level, tile_y):
+    # decode the band of the source covered by a row of tiles, at once
+    # (seekable sources only)
+    scale = self.getLevelScale(level)
+    level_width, _ = self.getLevelSize(level)
+    _, top, _, bottom = self.getTileBox(level, 0, tile_y)
+    box = (0, top * scale, self.width, min(bottom * scale, self.height))
+    band = normalizeMode(Crop.openRegion(self.imagepath, box, min(scale, MAX_DRAFT_SCALE)))
+    band_size = (level_width, bottom - top)
+    if band.size != band_size:
+      band = band.resize(band_size, Image.BILINEAR)
+    row = []
+    for tile_x in range(int(math.ceil(level_width / TILE_SIZE))):
+      left = tile_x * TILE_SIZE
+      image = band.crop((left, 0, min(left + TILE_SIZE, level_width), band_size[1]))
+      row.append(self.cachePut((level, tile_x, tile_y), image))
+    return row
+
+  @Profiling.timed('pyramid.decode_rows')
+  def loadLevelRows(self, level, tile_y):
+    # a row of a JPEG or PNG costs the decode of all the rows above it:
+    # cut the rows nearest to tile_y, up to half the budget, out of one
+    # decode stopping below the last of them; the row tile_y is cut last
+    # so that it is the last evicted
+    scale = self.getLevelScale(level)
+    level_width, level_height = self.getLevelSize(level)
+    rows = int(math.ceil(level_height / TILE_SIZE))
+    row_bytes = getImageBytes((level_width, TILE_SIZE), 'RGB')
+    count = min(max(int(self.max_bytes / 2 / row_bytes), 1), rows)
+    nearest = sorted(range(rows), key=lambda row_y: abs(row_y - tile_y))[:count]
+    _, _, _, bottom = self.getTileBox(level, 0, max(nearest))
+    box = (0, 0, self.width, min(bottom * scale, self.height))
+    band = normalizeMode(Crop.openRegion(self.imagepath, box, min(scale, MAX_DRAFT_SCALE)))
+    if band.size != (level_width, bottom):
+      band = band.resize((level_width, bottom), Image.BILINEAR)
+    columns = int(math.ceil(level_width / TILE_SIZE))
+    for row_y in reversed(nearest):
+      row = [self.cachePut((level, tile_x, row_y), band.crop(self.getTileBox(level, tile_x, row_y)))
+             for tile_x in range(columns)]
+    return row
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import threading
+import queue
+
+from src import Crop
+
+## SAVE QUEUE
+# Saves run one at a time on a worker thread, in the order they were
+# requested: the caller never blocks and output names can't collide.
+class SaveQueue():
+
+  def __init__(self, callback):
+    # callback(savepaths, error) is called from the worker thread
+    self.callback = callback
+    self.jobs = queue.Queue()
+    self.thread = threading.Thread(target=self.work, daemon=True)
+    self.thread.start()
+
+  def put(self, imagepath, box, output_format=Crop.FORMAT_PNG, quality=Crop.DEFAULT_QUALITY, sizes=None):
+    # sizes: longest sides of the copies to save (None for the full crop)
+    self.jobs.put((imagepath, box, None, output_format, quality, sizes))
+
+  def putRegions(self, imagepath, regions, output_format=Crop.FORMAT_PNG, quality=Crop.DEFAULT_QUALITY, sizes=None):
+    # regions: (name, box) pairs saved from a single decode
+    self.jobs.put((imagepath, None, regions, output_format, quality, sizes))
+
+  def pending(self):
+    return self.jobs.unfinished_tasks
+
+  def work(self):
+    while True:
+      job = self.jobs.get()
+      if job is None:
+        self.jobs.task_done()
+        break
+      imagepath, box, regions, output_format, quality, sizes = job
+      try:
+        if regions is not None:
+          savepaths = Crop.saveRegions(imagepath, regions, output_format, quality, sizes)
+        elif sizes is None:
+          savepaths = [Crop.saveCrop(imagepath, box, output_format, quality)]
+        else:
+          savepaths = Crop.saveLadder(imagepath, box, sizes, output_format, quality)
+        error = None
+      except Exception as e:
+        savepaths = None
+        error = e
+      self.jobs.task_done()
+      self.callback(savepaths, error)
+
+  def stop(self):
+    # wait for the queued saves to complete
+    self.jobs.put(None)
+    self.thread.join()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+
+## CROP SERVER
+# A long running process taking crop jobs on a Unix socket, so that each
+# crop doesn't pay for the interpreter startup and the imports, and the
+# decoded sources stay in the image cache between jobs.
+#
+# Protocol: one JSON object per line each way. A job has the fields of
+# the batch options, as strings or as lists like in manifests: path, box,
+# ratio, auto (trim or smart), format, quality and sizes; the reply has
+# path, savepaths, elapsed (seconds) and error. {"command": "stop"} stops
+# the server.
+
+COMMAND_STOP = 'stop'
+
+def getDefaultSocket():
+  folder = os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir())
+  return os.path.join(folder, 'image-crop-' + str(os.getuid()) + '.sock')
+
+## SERVER
+class RequestHandler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    for line in self.rfile:
+      line = line.strip()
+      if len(line) == 0:
+        continue
+      try:
+        request = json.loads(line)
+      except ValueError as e:
+        self.reply({'error': 'Invalid request: ' + str(e)})
+        continue
+      if not isinstance(request, dict):
+        self.reply({'error': 'Invalid request: not a JSON object'})
+        continue
+      if request.get('command') == COMMAND_STOP:
+        self.reply({'error': None})
+        # shutdown waits for serve_forever, which runs on another thread
+        threading.Thread(target=self.server.shutdown).start()
+        return
+      self.reply(self.server.crop(request))
+
+  def reply(self, response):
+    self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+    self.wfile.flush()
+
+class CropServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+  daemon_threads = True
+
+  def __init__(self, socket_path, workers=None):
+    # imported here (as Batch and Crop below): the client never loads PIL
+    from concurrent.futures import ThreadPoolExecutor
+    self.socket_path = socket_path
+    # PIL releases the GIL while decoding and encoding, and threads share
+    # the decoded image cache
+    self.executor = ThreadPoolExecutor(workers or os.cpu_count())
+    removeStaleSocket(socket_path)
+    socketserver.UnixStreamServer.__init__(self, socket_path, RequestHandler)
+
+  def makeJob(self, request):
+    from src import Batch
+    from src import Crop
+    from src.Manifest import joinValues
+    path = request['path']
+    box = Batch.parseBox(joinValues(request['box'])) if request.get('box') is not None else None
+    ratio = request.get('ratio')
+    if isinstance(ratio, (list, tuple)):
+      ratio = ':'.join([str(value) for value in ratio])
+    ratio = Batch.parseRatio(ratio) if ratio is not None else None
+    auto = request.get('auto')
+    if not auto in (None, Batch.AUTO_TRIM, Batch.AUTO_SMART):
+      raise ValueError('Invalid automatic crop: ' + str(auto))
+    output_format = request.get('format', Crop.FORMAT_PNG)
+    if not output_format in Crop.OUTPUT_FORMATS:
+      raise ValueError('Invalid format: ' + str(output_format))
+    quality = request.get('quality')
+    quality = int(quality) if quality is not None else Crop.DEFAULT_QUALITY
+    sizes = Batch.parseSizes(joinValues(request['sizes'])) if request.get('sizes') is not None else None
+    job = Batch.makeJob(path, box, ratio, auto)
+    Batch.setOutput([job], output_format, quality, sizes)
+    return job
+
+  def crop(self, request):
+    # any error is the reply to this request only: the connection and the
+    # server keep going
+    from src import Batch
+    from src import Crop
+    try:
+      job = self.makeJob(request)
+      future = self.executor.submit(Batch.cropJob, job, Crop.IMAGE_CACHE)
+      path, savepaths, elapsed, error = future.result()
+    except KeyError as e:
+      return {'path': request.get('path'), 'savepaths': None, 'elapsed': 0, 'error': 'Missing field: ' + str(e)}
+    except Exception as e:
+      return {'path': request.get('path'), 'savepaths': None, 'elapsed': 0, 'error': str(e)}
+    return {'path': path, 'savepaths': savepaths, 'elapsed': elapsed, 'error': error}
+
+  def close(self):
+    self.server_close()
+    self.executor.shutdown()
+    if os.path.exists(self.socket_path):
+      os.remove(self.socket_path)
+
+def removeStaleSocket(socket_path):
+  # a socket left by a server that is gone; refuse to replace a live one
+  if not os.path.exists(socket_path):
+    return
+  if isRunning(socket_path):
+    raise RuntimeError('A server is already running on ' + socket_path)
+  os.remove(socket_path)
+
+def isRunning(socket_path):
+  try:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+      connection.connect(socket_path)
+    return True
+  except OSError:
+    return False
+
+def serve(socket_path=None, workers=None, output=sys.stdout):
+  socket_path = socket_path or getDefaultSocket()
+  server = CropServer(socket_path, workers)
+  output.write('Listening on %s\n' % socket_path)
+  output.flush()
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.close()
+
+## CLIENT
+class Client():
+
+  def __init__(self, socket_path=None):
+    self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.connection.connect(socket_path or getDefaultSocket())
+    self.stream = self.connection.makefile('rwb')
+
+  def send(self, request):
+    self.stream.write((json.dumps(request) + '\n').encode('utf-8'))
+    self.stream.flush()
+    line = self.stream.readline()
+    if len(line) == 0:
+      raise ConnectionError('The server closed the connection')
+    return json.loads(line)
+
+  def crop(self, path, **options):
+    # options: box, ratio, auto, format, quality, sizes (as strings)
+    request = {'path': os.path.abspath(path)}
+    for key, value in options.items():
+      if value is not None:
+        request[key] = value
+    return self.send(request)
+
+  def stop(self):
+    return self.send({'command': COMMAND_STOP})
+
+  def close(self):
+    self.stream.close()
+    self.connection.close()
+
+def sendJobs(paths, socket_path=None, output=sys.stdout, **options):
+  client = Client(socket_path)
+  failed = 0
+  try:
+    for path in paths:
+      response = client.crop(path, **options)
+      if response['error'] is None:
+        savenames = ', '.join([os.path.basename(savepath) for savepath in response['savepaths']])
+        output.write('%s -> %s (%.1f ms)\n' % (path, savenames, response['elapsed'] * 1000))
+      else:
+        failed += 1
+        output.write('%s: ERROR %s\n' % (path, response['error']))
+  finally:
+    client.close()
+  return failed == 0
+
+def stopServer(socket_path=None):
+  client = Client(socket_path)
+  try:
+    client.stop()
+  finally:
+    client.close()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src import Pyramid
+from src.Batch import isImage
+from src.Geometry import getScaleFactor
+
+DEFAULT_PREFETCH = 3
+DEFAULT_SESSION_SIZE = 256 * 1024 * 1024
+PREFETCH_THREADS = 2
+
+def listImages(addresses):
+  # folders are expanded to the images they contain
+  paths = []
+  for address in addresses:
+    if os.path.isdir(address):
+      for name in sorted(os.listdir(address)):
+        path = os.path.join(address, name)
+        if os.path.isfile(path) and isImage(path):
+          paths.append(path)
+    else:
+      paths.append(address)
+  return paths
+
+## SESSION
+# A list of images with next/previous navigation. The previews of the
+# next images are decoded ahead of time on background threads and kept
+# within a memory budget, so that moving to them is instant.
+class Session():
+
+  def __init__(self, addresses, view_size, convert=None, prefetch=DEFAULT_PREFETCH, max_bytes=DEFAULT_SESSION_SIZE):
+    self.paths = listImages(addresses)
+    self.index = 0
+    self.view_size = view_size
+    self.convert = convert
+    self.prefetch = prefetch
+    self.max_bytes = max_bytes
+    self.pyramids = OrderedDict()
+    self.pending = {}
+    self.lock = threading.Lock()
+    self.executor = ThreadPoolExecutor(max_workers=PREFETCH_THREADS)
+    # the first image is decoded while the window is built
+    self.schedule()
+
+  # GET
+  def getPath(self):
+    if len(self.paths) == 0:
+      return None
+    return self.paths[self.index]
+
+  def getIndex(self):
+    return self.index
+
+  def getCount(self):
+    return len(self.paths)
+
+  def getPyramid(self):
+    # preview of the current image, None if PIL can't read it
+    path = self.getPath()
+    if path is None:
+      return None
+    with self.lock:
+      pyramid = self.pyramids.get(path)
+      future = self.pending.get(path)
+    if pyramid is None and future is not None:
+      pyramid = future.result()
+    elif pyramid is None:
+      pyramid = self.loadPyramid(path, False)
+      self.store(path, pyramid)
+    self.schedule()
+    return pyramid
+
+  # NAVIGATION
+  def next(self):
+    if self.index + 1 < len(self.paths):
+      self.index += 1
+      return True
+    return False
+
+  def previous(self):
+    if self.index > 0:
+      self.index -= 1
+      return True
+    return False
+
+  def goTo(self, path):
+    self.index = self.paths.index(path)
+
+  def discard(self, path):
+    # forget an image that can't be loaded
+    index = self.paths.index(path)
+    del self.paths[index]
+    if self.index > index or self.index == len(self.paths):
+      self.index = max(self.index - 1, 0)
+    with self.lock:
+      self.pyramids.pop(path, None)
+
+  # PREFETCH
+  def loadPyramid(self, path, preload=True):
+    try:
+      pyramid = Pyramid.TilePyramid(path, convert=self.convert)
+    except Exception:
+      return None
+    if preload:
+      width, height = pyramid.getSize()
+      view_width, view_height = self.view_size
+      pyramid.loadView(getScaleFactor(width, height, view_width, view_height))
+    return pyramid
+
+  def prefetchPath(self, path):
+    pyramid = self.loadPyramid(path)
+    self.store(path, pyramid)
+    return pyramid
+
+  def store(self, path, pyramid):
+    with self.lock:
+      self.pending.pop(path, None)
+      if pyramid is not None:
+        self.pyramids[path] = pyramid
+    self.trim()
+
+  def getWindow(self):
+    # images worth keeping: the previous one, the current one and the next ones
+    first = max(self.index - 1, 0)
+    last = min(self.index + self.prefetch, len(self.paths) - 1)
+    return self.paths[first:last + 1]
+
+  def schedule(self):
+    window = self.getWindow()
+    with self.lock:
+      for path in window:
+        if path in self.pyramids or path in self.pending:
+          continue
+        self.pending[path] = self.executor.submit(self.prefetchPath, path)
+    self.trim()
+
+  def trim(self):
+    current = self.getPath()
+    window = self.getWindow()
+    with self.lock:
+      for path in list(self.pyramids.keys()):
+        if not path in window:
+          del self.pyramids[path]
+      # over budget: drop the furthest images first, never the current one
+      size = sum([pyramid.size for pyramid in self.pyramids.values()])
+      for path in reversed(window):
+        if size <= self.max_bytes:
+          break
+        if path != current and path in self.pyramids:
+          size -= self.pyramids.pop(path).size
+
+  def stop(self):
+    self.executor.shutdown(wait=False)
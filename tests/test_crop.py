@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from PIL import Image
+
+from src import Crop
+
+# not multiples of the MCU size
+WIDTH = 203
+HEIGHT = 397
+
+# top rows, middle, across an MCU row, down to the last row, everything
+BOXES = [(0, 0, 50, 10), (31, 100, 180, 161), (7, 15, 203, 17), (20, 300, 120, 397), (0, 0, WIDTH, HEIGHT)]
+
+JPEG_OPTIONS = {'baseline': {'quality': 90},
+                'progressive': {'quality': 90, 'progressive': True},
+                '444': {'quality': 90, 'subsampling': 0},
+                'gray': {'quality': 90}}
+
+def getTestImage(mode):
+  image = Image.new('RGB', (WIDTH, HEIGHT))
+  image.putdata([((x * 5) % 256, (y * 3) % 256, (x * y) % 256) for y in range(HEIGHT) for x in range(WIDTH)])
+  return image.convert(mode)
+
+class JpegRegionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp.cleanup()
+
+  def testSameAsFullDecode(self):
+    for name, options in JPEG_OPTIONS.items():
+      path = os.path.join(self.temp.name, name + '.jpg')
+      getTestImage('L' if name == 'gray' else 'RGB').save(path, **options)
+      with Image.open(path) as image:
+        image.load()
+        for box in BOXES:
+          region = Crop.openRegion(path, box)
+          self.assertEqual(region.size, (box[2] - box[0], box[3] - box[1]))
+          self.assertEqual(region.tobytes(), image.crop(box).tobytes(), (name, box))
+
+  def testHeightOffset(self):
+    # the height in the SOF header is where findJpegHeightOffset says
+    path = os.path.join(self.temp.name, 'image.jpg')
+    getTestImage('RGB').save(path, quality=90)
+    with open(path, 'rb') as hand:
+      offset = Crop.findJpegHeightOffset(hand)
+      hand.seek(offset)
+      self.assertEqual(int.from_bytes(hand.read(2), 'big'), HEIGHT)
+
+if __name__ == '__main__':
+  unittest.main()
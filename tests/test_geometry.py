@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import sys
+import unittest
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from src import Geometry
+from src.Geometry import CropBox
+
+# normalized boxes in 1/STEPS and image sides multiple of STEPS, so that
+# the pixel boxes are exact in floating point
+STEPS = 1024
+
+def getScalarBox(image_size, box, ratio):
+  # the box of fitBoxes, one CropBox at a time
+  crop = CropBox(*image_size)
+  x, y, width, height = box
+  if ratio is not None:
+    crop.setRatio(*ratio)
+    width, height = crop.fitToArea(width, height)
+  crop.clampTo(x, y, width, height)
+  x, y, width, height = crop.getBox()
+  return x, y, x + width, y + height
+
+class FitBoxesTest(unittest.TestCase):
+
+  def testSameAsCropBox(self):
+    generator = random.Random(7)
+    for ratio in [None, (16, 9), (3, 2), Geometry.A4_RATIO, (1, 1)]:
+      for _ in range(20):
+        steps = [generator.randint(0, STEPS) for _ in range(4)]
+        normalized_box = [step / STEPS for step in steps]
+        sizes = [(STEPS * generator.randint(1, 8), STEPS * generator.randint(1, 8)) for _ in range(5)]
+        boxes = Geometry.fitBoxes(normalized_box, sizes, ratio)
+        for size, box in zip(sizes, boxes):
+          scale_x, scale_y = size[0] // STEPS, size[1] // STEPS
+          pixel_box = (steps[0] * scale_x, steps[1] * scale_y, steps[2] * scale_x, steps[3] * scale_y)
+          self.assertEqual(box, getScalarBox(size, pixel_box, ratio))
+
+class CropBoxTest(unittest.TestCase):
+
+  def testIntegerSides(self):
+    crop = CropBox(5000, 5000)
+    crop.setRatio(16, 9)
+    crop.setWidth(1000)
+    self.assertEqual(crop.getSize(), (1000, 562))
+    crop.setHeight(1001)
+    self.assertEqual(crop.getSize(), (1779, 1001))
+    for value in crop.getBox():
+      self.assertIsInstance(value, int)
+
+  def testNoDrift(self):
+    for ratio, size in [(Geometry.A4_RATIO, (2100, 2970)), ((16, 9), (1000, 562)), ((3, 2), (999, 666))]:
+      crop = CropBox(5000, 5000)
+      crop.setRatio(*ratio)
+      crop.setSize(*size)
+      for _ in range(100):
+        crop.checkRatio()
+      self.assertEqual(crop.getSize(), size)
+
+  def testCheckRatioFitsHeight(self):
+    # the width can't set the height: the height sets the width
+    crop = CropBox(5000, 1000)
+    crop.setRatio(1, 1)
+    crop.setSize(2000, 800)
+    crop.checkRatio()
+    self.assertEqual(crop.getSize(), (800, 800))
+    crop.checkRatio()
+    self.assertEqual(crop.getSize(), (800, 800))
+
+if __name__ == '__main__':
+  unittest.main()
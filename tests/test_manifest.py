@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from PIL import Image
+
+from src import Batch
+from src import Crop
+from src import Manifest
+
+class JournalTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp = tempfile.TemporaryDirectory()
+    self.folder = self.temp.name
+    for i in range(3):
+      Image.new('RGB', (120, 80), (40 * i, 80, 120)).save(self.path('scan-%d.png' % i))
+    self.manifest = self.path('crops.jsonl')
+    self.entries = [{'path': 'scan-%d.png' % i, 'box': [10, 10, 50, 30], 'output': 'out/%d.png' % i} for i in range(3)]
+    self.writeManifest()
+    self.defaults = Batch.makeJob(None)
+    Batch.setOutput([self.defaults], Crop.FORMAT_PNG, Crop.DEFAULT_QUALITY)
+
+  def tearDown(self):
+    self.temp.cleanup()
+
+  def path(self, name):
+    return os.path.join(self.folder, name)
+
+  def writeManifest(self, extra=''):
+    with open(self.manifest, 'w') as hand:
+      for entry in self.entries:
+        hand.write(json.dumps(entry) + '\n')
+      hand.write(extra)
+
+  def crop(self):
+    # (success, files written by this run, output)
+    output = io.StringIO()
+    before = self.getOutputs()
+    success = Manifest.start(self.manifest, self.defaults, 1, output)
+    after = self.getOutputs()
+    written = sorted([name for name in after if after[name] != before.get(name)])
+    return success, written, output.getvalue()
+
+  def getOutputs(self):
+    folder = self.path('out')
+    if not os.path.isdir(folder):
+      return {}
+    return {name: os.stat(os.path.join(folder, name)).st_mtime_ns for name in os.listdir(folder)}
+
+  def testResumeSkipsDoneEntries(self):
+    success, written, _ = self.crop()
+    self.assertTrue(success)
+    self.assertEqual(written, ['0.png', '1.png', '2.png'])
+    self.assertEqual(Image.open(self.path('out/0.png')).size, (50, 30))
+    success, written, output = self.crop()
+    self.assertTrue(success)
+    self.assertEqual(written, [])
+    self.assertIn('Skipped 3 entries', output)
+
+  def testChangedSourceOrParameters(self):
+    self.crop()
+    Image.new('RGB', (140, 90), (0, 0, 0)).save(self.path('scan-1.png'))
+    self.entries[2]['box'] = [0, 0, 20, 20]
+    self.writeManifest()
+    _, written, _ = self.crop()
+    self.assertEqual(written, ['1.png', '2.png'])
+    self.assertEqual(Image.open(self.path('out/2.png')).size, (20, 20))
+
+  def testCutJournalLine(self):
+    self.crop()
+    journal = self.manifest + Manifest.JOURNAL_EXTENSION
+    with open(journal, 'r') as hand:
+      lines = hand.readlines()
+    # a crash in the middle of the last record
+    with open(journal, 'w') as hand:
+      hand.writelines(lines[:-1])
+      hand.write(lines[-1][:10])
+    _, written, _ = self.crop()
+    self.assertEqual(len(written), 1)
+    # the record of the entry done again is readable
+    success, written, output = self.crop()
+    self.assertTrue(success)
+    self.assertEqual(written, [])
+    self.assertIn('Skipped 3 entries', output)
+
+  def testInvalidEntries(self):
+    self.writeManifest('{"path": "scan-0.png", "box": "1,2"}\nnot json\n')
+    success, written, output = self.crop()
+    self.assertFalse(success)
+    self.assertEqual(written, ['0.png', '1.png', '2.png'])
+    self.assertIn('2 invalid entries', output)
+
+  def testInvalidScale(self):
+    extra = ''
+    for scale in [0, -0.5]:
+      extra += json.dumps({'path': 'scan-0.png', 'box': [10, 10, 50, 30], 'scale': scale}) + '\n'
+    self.writeManifest(extra)
+    success, written, output = self.crop()
+    self.assertFalse(success)
+    self.assertEqual(written, ['0.png', '1.png', '2.png'])
+    self.assertIn('Invalid scale', output)
+    self.assertIn('2 invalid entries', output)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from PIL import Image
+from PIL import TiffImagePlugin
+from PIL import features
+
+from src import Crop
+from src import Mapped
+
+BOXES = [(0, 0, 70, 100), (13, 15, 50, 17), (10, 99, 11, 100), (5, 31, 69, 33)]
+
+def getTestImage(mode):
+  image = Image.new(mode, (70, 100))
+  image.putdata([(i * 7 + (i // 70) * 3) % 256 if mode == 'L' else ((i * 7) % 256, (i // 70) % 256, i % 251)
+                 for i in range(70 * 100)])
+  return image
+
+class MappedTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp.cleanup()
+
+  def checkCrops(self, path, strips):
+    with Image.open(path) as image:
+      layout = Mapped.getLayout(image)
+      self.assertIsNotNone(layout)
+      self.assertEqual(len(layout[0]), strips)
+      image.load()
+      for box in BOXES:
+        self.assertEqual(Crop.openRegion(path, box).tobytes(), image.crop(box).tobytes())
+
+  def testSingleStrip(self):
+    for mode in ['L', 'RGB']:
+      path = os.path.join(self.temp.name, mode + '.ppm')
+      getTestImage(mode).save(path)
+      self.checkCrops(path, 1)
+
+  @unittest.skipUnless(features.check('libtiff'), 'needs libtiff')
+  def testManyStrips(self):
+    path = os.path.join(self.temp.name, 'strips.tif')
+    TiffImagePlugin.WRITE_LIBTIFF = True
+    try:
+      # 16 rows per strip
+      getTestImage('RGB').save(path, compression='raw', tiffinfo={278: 16})
+    finally:
+      TiffImagePlugin.WRITE_LIBTIFF = False
+    self.checkCrops(path, 7)
+
+  def testCompressed(self):
+    path = os.path.join(self.temp.name, 'image.tif')
+    getTestImage('RGB').save(path, compression='tiff_lzw')
+    with Image.open(path) as image:
+      self.assertIsNone(Mapped.getLayout(image))
+
+if __name__ == '__main__':
+  unittest.main()
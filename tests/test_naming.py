@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from src import Naming
+
+def touch(folder, name):
+  with open(os.path.join(folder, name), 'w'):
+    pass
+
+class NameAllocatorTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp = tempfile.TemporaryDirectory()
+    self.folder = self.temp.name
+    self.allocator = Naming.NameAllocator()
+
+  def tearDown(self):
+    self.temp.cleanup()
+
+  def claim(self, name, extensions=('.png',)):
+    savepaths = self.allocator.claim(os.path.join(self.folder, name), list(extensions))
+    return [os.path.basename(savepath) for savepath in savepaths]
+
+  def testFirstName(self):
+    self.assertEqual(self.claim('a.jpg'), ['a.resized.png'])
+    self.assertEqual(self.claim('a.jpg'), ['a.resized-1.png'])
+
+  def testExistingIndexes(self):
+    for name in ('a.resized.png', 'a.resized-4.png', 'a.resized-9.jpg', 'b.resized-2.png',
+                 'a.resized.resized-7.png', 'c.png'):
+      touch(self.folder, name)
+    self.assertEqual(self.claim('a.jpg'), ['a.resized-5.png'])
+    self.assertEqual(self.claim('b.jpg'), ['b.resized-3.png'])
+    self.assertEqual(self.claim('c.png'), ['c.resized.png'])
+    self.assertEqual(self.claim('a.resized.png'), ['a.resized.resized-8.png'])
+    self.assertEqual(self.claim('a.jpg', ['.jpg']), ['a.resized-10.jpg'])
+
+  def testFolderScannedOnce(self):
+    scans = []
+    scan = self.allocator.scan
+    self.allocator.scan = lambda folder: scans.append(folder) or scan(folder)
+    for i in range(20):
+      self.claim(str(i) + '.jpg')
+    self.assertEqual(len(scans), 1)
+
+  def testCreatedAfterScan(self):
+    # another process took the next name: O_EXCL moves past it
+    self.claim('a.jpg')
+    touch(self.folder, 'a.resized-1.png')
+    self.assertEqual(self.claim('a.jpg'), ['a.resized-2.png'])
+
+  def testGroupSharesIndex(self):
+    touch(self.folder, 'a.resized.png')
+    touch(self.folder, 'a.resized-2.512px.png')
+    self.assertEqual(self.claim('a.jpg', ['.png', '.512px.png']), ['a.resized-3.png', 'a.resized-3.512px.png'])
+    # a name taken since the scan skips the index for the whole group
+    touch(self.folder, 'a.resized-4.512px.png')
+    self.assertEqual(self.claim('a.jpg', ['.png', '.512px.png']), ['a.resized-5.png', 'a.resized-5.512px.png'])
+    self.assertFalse(os.path.exists(os.path.join(self.folder, 'a.resized-4.png')))
+
+  def testParallelClaims(self):
+    # threads sharing an allocator and allocators as separate processes
+    allocators = [self.allocator, Naming.NameAllocator(), Naming.NameAllocator()]
+    results = []
+    lock = threading.Lock()
+    def work(allocator):
+      names = []
+      for _ in range(50):
+        names.extend(allocator.claim(os.path.join(self.folder, 'a.jpg'), ['.png', '.256px.png']))
+      with lock:
+        results.extend(names)
+    threads = [threading.Thread(target=work, args=(allocators[i % len(allocators)],)) for i in range(9)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(results), 9 * 50 * 2)
+    self.assertEqual(len(set(results)), len(results))
+    self.assertEqual(len(os.listdir(self.folder)), len(results))
+
+if __name__ == '__main__':
+  unittest.main()
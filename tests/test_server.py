@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+MAIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_FOLDER)
+
+from PIL import Image
+
+from src import Server
+
+# seconds to wait for the server to start or stop
+TIMEOUT = 10
+
+class ServerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp = tempfile.TemporaryDirectory()
+    self.folder = self.temp.name
+    self.image = os.path.join(self.folder, 'photo.png')
+    Image.new('RGB', (160, 90), (30, 120, 200)).save(self.image)
+    self.socket_path = os.path.join(self.folder, 'crop.sock')
+    # as ./crop.py --serve does, with the socket removed on the way out
+    self.thread = threading.Thread(target=Server.serve, args=(self.socket_path, 2, io.StringIO()))
+    self.thread.start()
+    deadline = time.time() + TIMEOUT
+    while not Server.isRunning(self.socket_path):
+      if time.time() > deadline:
+        self.fail('The server did not start')
+      time.sleep(0.01)
+    self.client = Server.Client(self.socket_path)
+
+  def tearDown(self):
+    self.client.close()
+    if self.thread.is_alive():
+      Server.stopServer(self.socket_path)
+      self.thread.join(TIMEOUT)
+    self.temp.cleanup()
+
+  def sendLine(self, line):
+    # raw bytes, for requests that Client.send can't write
+    self.client.stream.write(line + b'\n')
+    self.client.stream.flush()
+    return json.loads(self.client.stream.readline())
+
+  def testCrop(self):
+    response = self.client.crop(self.image, box='10,20,64,48')
+    self.assertIsNone(response['error'])
+    self.assertEqual(response['path'], self.image)
+    self.assertEqual(len(response['savepaths']), 1)
+    with Image.open(response['savepaths'][0]) as image:
+      self.assertEqual(image.size, (64, 48))
+
+  def testErrorsKeepConnection(self):
+    response = self.sendLine(b'{"path": ')
+    self.assertIn('Invalid request', response['error'])
+    response = self.sendLine(b'[1, 2]')
+    self.assertEqual(response['error'], 'Invalid request: not a JSON object')
+    response = self.client.send({'ratio': '16:9'})
+    self.assertEqual(response['error'], "Missing field: 'path'")
+    self.assertIsNone(response['savepaths'])
+    # all of them on the same connection, which still crops
+    response = self.client.crop(self.image, ratio='1:1')
+    self.assertIsNone(response['error'])
+    with Image.open(response['savepaths'][0]) as image:
+      self.assertEqual(image.size, (90, 90))
+
+  def testStop(self):
+    self.assertEqual(self.client.stop(), {'error': None})
+    self.thread.join(TIMEOUT)
+    self.assertFalse(self.thread.is_alive())
+    self.assertFalse(os.path.exists(self.socket_path))
+    with self.assertRaises(OSError):
+      with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(self.socket_path)
+
+if __name__ == '__main__':
+  unittest.main()